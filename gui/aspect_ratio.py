@@ -76,6 +76,8 @@ class Ratios:
         self.main_menu_document_cloud_padding = int(20 * scale)  # 10 on each size (left and right) / (top and bottom)
         self.main_menu_path_size = int(15.8 * scale)
         self.main_menu_bar_size = self.main_menu_path_size
+        self.main_menu_search_width = int(180 * scale)
+        self.main_menu_search_height = int(30 * scale)
         self.main_menu_bar_padding = int(20 * scale)
         self.document_sync_progress_height = int(8 * scale)
         self.document_sync_progress_margin = int(10 * scale)
@@ -24,7 +24,8 @@ def get_asset_path():
             print("Running in development")
         pe.settings.indev = True
         base_asset_dir = os.path.abspath(".")
-        script_dir = os.path.abspath(os.path.dirname(__main__.__file__))
+        # The repository, where moss.py is, even when a tool is what is running
+        script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
     if pe.settings.config.debug:
         print(f"Base asset dir: {base_asset_dir}")
@@ -7,7 +7,7 @@ import time
 from numbers import Number
 from os import makedirs
 from pprint import pformat
-from typing import TypedDict, Union, TYPE_CHECKING
+from typing import TypedDict, Union, TYPE_CHECKING, Optional
 
 import appdirs
 import colorama
@@ -20,7 +20,7 @@ from rm_api.notifications.models import APIFatal, Notification, LongLasting
 
 from .events import ResizeEvent, MossFatal, ScreenClosure
 from .literals import PDF_RENDER_MODES, NOTEBOOK_RENDER_MODES, MAIN_MENU_MODES, MAIN_MENU_LOCATIONS, \
-    DOCUMENT_VIEWER_MODES
+    DOCUMENT_VIEWER_MODES, MAIN_MENU_SORTING_MODES
 
 Defaults: 'defaults.Defaults' = None
 
@@ -80,6 +80,13 @@ class ConfigDict(TypedDict):
     document_viewer_mode: DOCUMENT_VIEWER_MODES
     download_everything: bool
     download_last_opened_page_to_make_preview: bool
+    preview_cache_budget_mb: Number
+    preview_workers: int
+    preview_upload_budget_ms: Number
+    viewer_tile_cache_mb: Number
+    viewer_chunk_workers: int
+    viewer_renderer_pool: int
+    viewer_page_prefetch: int
     save_last_opened_folder: bool
     save_after_close: bool
     last_opened_folder: Union[None, str]
@@ -88,6 +95,8 @@ class ConfigDict(TypedDict):
     doc_view_scale: Number
     main_menu_view_mode: MAIN_MENU_MODES
     main_menu_menu_location: MAIN_MENU_LOCATIONS
+    main_menu_sorting_mode: MAIN_MENU_SORTING_MODES
+    main_menu_sorting_reverse: bool
     format_raw_exports: bool
     add_ext_to_raw_exports: bool
     debug: bool
@@ -119,6 +128,13 @@ DEFAULT_CONFIG: ConfigDict = {
     'document_viewer_mode': 'read',
     'download_everything': False,
     'download_last_opened_page_to_make_preview': False,
+    'preview_cache_budget_mb': 256,
+    'preview_workers': 4,
+    'preview_upload_budget_ms': 2,
+    'viewer_tile_cache_mb': 128,
+    'viewer_chunk_workers': 4,
+    'viewer_renderer_pool': 4,
+    'viewer_page_prefetch': 2,
     'save_last_opened_folder': True,
     'save_after_close': True,
     'last_opened_folder': None,
@@ -127,6 +143,8 @@ DEFAULT_CONFIG: ConfigDict = {
     'doc_view_scale': 1,
     'main_menu_view_mode': 'grid',
     'main_menu_menu_location': 'my_files',
+    'main_menu_sorting_mode': 'last_modified',
+    'main_menu_sorting_reverse': True,
     'format_raw_exports': True,
     'add_ext_to_raw_exports': True,
     'debug': False,
@@ -264,6 +282,9 @@ class GUI(pe.GameContext):
     HEIGHT = 1000
     WIDTH = int(HEIGHT * ASPECT)
     FPS = 60
+    UNFOCUSED_FPS = 10
+    IDLE_REDRAW_TIME = 1  # How often a screen that skips idle frames is still redrawn
+    INPUT_REDRAW_TIME = .5  # Keep drawing for a moment after any input, for hovers and key repeats
     TITLE = f"{AUTHOR} {APP_NAME}"
     MODE = pe.display.DISPLAY_MODE_RESIZABLE
     FAKE_SCREEN_REFRESH_TIME = .1
@@ -346,6 +367,12 @@ class GUI(pe.GameContext):
         self.original_screen_refresh_surface: pe.Surface = None
         self.fake_screen_refresh_surface: pe.Surface = None
         self.last_screen_count = 1
+        self.redraw_requested = True
+        self.redraw_until = 0
+        self.waiting_for_redraw = False
+        self.wake_event = pe.pygame.event.custom_type()
+        self.frame_started: Optional[float] = None
+        self.frame_delta = 1 / self.FPS
         self.api.add_hook('GUI', self.handle_api_event)
         pe.display.set_icon(Defaults.APP_ICON)
         self.create_directories()
@@ -357,6 +384,10 @@ class GUI(pe.GameContext):
         makedirs(Defaults.OPTIONS_DIR, exist_ok=True)
         makedirs(Defaults.THUMB_FILE_PATH, exist_ok=True)
 
+        # Open the packed thumbnails once, this also moves over any older PNG thumbnails
+        from .preview_handler import PreviewHandler
+        PreviewHandler.THUMBNAILS.load()
+
     def add_screen(self, screen):
         self.long_refresh()
         self.screens.append(screen)
@@ -424,15 +455,75 @@ class GUI(pe.GameContext):
         self.ctrl_hold = mods & self.ctrl_key
         self.shift_hold = mods & pe.pygame.KMOD_SHIFT
 
+        # Turn the previews that finished loading into sprites
+        from .preview_handler import PreviewHandler
+        PreviewHandler.upload_ready()
+        if PreviewHandler.READY:
+            self.invalidate()  # Continue uploading next frame
+
         super().pre_loop()
 
     def quick_refresh(self):
         self.reset_fake_screen_refresh = False
         self.fake_screen_refresh_timer = time.time() - self.FAKE_SCREEN_REFRESH_TIME * 5
+        self.invalidate()
 
     def long_refresh(self):
         self.reset_fake_screen_refresh = False
         self.fake_screen_refresh_timer = time.time()
+        self.invalidate()
+
+    def invalidate(self, duration: float = 0):
+        """Redraw the next frame, or keep redrawing for the duration. Can be called from any thread"""
+        self.redraw_requested = True
+        if duration:
+            self.redraw_until = max(self.redraw_until, time.time() + duration)
+        if self.waiting_for_redraw:
+            # Wake up the main thread
+            self.waiting_for_redraw = False
+            pe.pygame.event.post(pe.pygame.event.Event(self.wake_event))
+
+    @property
+    def needs_redraw(self):
+        if not self.running or not self.screens:
+            return True
+        if not getattr(self.current_screen, 'SKIP_IDLE_FRAMES', False):
+            return True
+        return any((
+            self.redraw_requested,
+            time.time() < self.redraw_until,
+            self.warning,
+            self.doing_fake_screen_refresh,
+            not self.reset_fake_screen_refresh,
+        ))
+
+    def wait_for_redraw(self):
+        """Sleep until something needs to be drawn, an event comes in or the idle redraw time passes"""
+        self.waiting_for_redraw = True
+        try:
+            if self.redraw_requested:
+                return
+            event = pe.pygame.event.wait(int(self.IDLE_REDRAW_TIME * 1000))
+            if event.type not in (pe.pygame.NOEVENT, self.wake_event):
+                # Leave the event for the frame to handle
+                pe.pygame.event.post(event)
+        finally:
+            self.waiting_for_redraw = False
+
+    def __call__(self):
+        if not self.needs_redraw:
+            self.wait_for_redraw()
+            # The time spent waiting is not part of the next frame
+            self.frame_started = None
+        now = time.perf_counter()
+        self.frame_delta = now - self.frame_started if self.frame_started else 1 / self.FPS
+        self.frame_started = now
+        self.redraw_requested = False
+        super().__call__()
+
+    @property
+    def delta_time(self):
+        return self.frame_delta
 
     def loop(self):
         if not self.running:
@@ -516,6 +607,13 @@ class GUI(pe.GameContext):
         pass
 
     def handle_event(self, e: pe.event.Event):
+        if e.type == self.wake_event:
+            return
+        self.invalidate(self.INPUT_REDRAW_TIME)
+        if e.type == pe.pygame.WINDOWFOCUSLOST:
+            self.FPS = self.UNFOCUSED_FPS
+        elif e.type == pe.pygame.WINDOWFOCUSGAINED:
+            self.FPS = GUI.FPS
         if pe.event.resize_check():
             self.api.spread_event(ResizeEvent(pe.display.get_size()))
         if self.current_screen.handle_event != self.handle_event:
@@ -577,6 +675,7 @@ class GUI(pe.GameContext):
             self.quit()
 
     def handle_api_event(self, e):
+        self.invalidate()
         if self.config.debug_api_events and self.running:
             event_dict = {k: v.__dict__ if isinstance(v, Notification) or isinstance(v, LongLasting) else v for k, v in
                           e.__dict__.items()}
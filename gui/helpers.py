@@ -1,4 +1,8 @@
-from typing import TYPE_CHECKING
+import locale
+import re
+from functools import lru_cache
+from itertools import accumulate
+from typing import TYPE_CHECKING, Dict, List
 
 import pygameextra as pe
 
@@ -6,6 +10,23 @@ if TYPE_CHECKING:
     from gui import GUI
 
 
+try:
+    # Compare text in the order of the user's language
+    locale.setlocale(locale.LC_COLLATE, '')
+except locale.Error:
+    pass
+
+NUMBERS_PATTERN = re.compile(r'([0-9]+)')
+
+
+def natural_sort_key(text: str) -> tuple:
+    """Sorts the numbers within the text by their value, so page 2 comes before page 10"""
+    return tuple(
+        int(part) if i % 2 else locale.strxfrm(part.casefold())
+        for i, part in enumerate(NUMBERS_PATTERN.split(text))
+    )
+
+
 def remove_excess_spaces(text: str):
     return " ".join(text.strip().split())
 
@@ -37,44 +58,76 @@ def shorten_name(name, letters=16, max_length=20):
     return name
 
 
+# Font : {character : advance}, measuring every character once per font
+GLYPH_ADVANCES: Dict[pe.pygame.font.Font, Dict[str, int]] = {}
+
+
+def get_advances(text: str, font: pe.pygame.font.Font) -> List[int]:
+    advances = GLYPH_ADVANCES.setdefault(font, {})
+    if missing := ''.join(set(text).difference(advances)):
+        for character, metric in zip(missing, font.metrics(missing)):
+            advances[character] = metric[4] if metric else 0
+    return [advances[character] for character in text]
+
+
+def get_prefix_widths(text: str, font: pe.pygame.font.Font) -> List[int]:
+    """The width of every prefix of the text, the first being empty"""
+    return list(accumulate(get_advances(text, font), initial=0))
+
+
 def check_width(text: str, font: pe.pygame.font.Font):
-    metrics = font.metrics(text)
-    x = 0
-    for metric in metrics:
-        x += metric[4]
-    return x
+    return sum(get_advances(text, font))
 
 
+@lru_cache(maxsize=4096)
 def dotted_dynamic_text(name: str, font: pe.pygame.Font, width: int):
+    # Cut the same amount of characters from both sides of the center until it fits
+    prefix_widths = get_prefix_widths(name, font)
+    total_width = prefix_widths[-1]
+    dots_width = check_width('...', font)
     center = len(name) // 2
-    left = center
-    right = center
 
-    while check_width(name[:left] + '...' + name[right:], font) > width:
-        left -= 1
-        right += 1
+    def fits(cut: int):
+        return prefix_widths[center - cut] + dots_width + total_width - prefix_widths[center + cut] <= width
+
+    if not fits(center):
+        return '...'
+    low, high = 0, center
+    while low < high:
+        cut = (low + high) // 2
+        if fits(cut):
+            high = cut
+        else:
+            low = cut + 1
 
-    return name[:left] + '...' + name[right:]
+    return name[:center - low] + '...' + name[center + low:]
 
 
+@lru_cache(maxsize=1024)
 def new_lined_dynamic_text(name: str, font: pe.pygame.Font, width: int):
     lines = []
     words = name.split(' ')
     line = []
+    line_width = 0
+    space_width = check_width(' ', font)
     for word in words:
         word = word.replace('\n', '').strip()
         if not word:
             continue
-        if check_width(' '.join(line + [word]), font) > width:
+        word_width = check_width(word, font)
+        if (line_width + space_width if line else 0) + word_width > width:
             lines.append(' '.join(line).strip())
             line = [word]
+            line_width = word_width
         else:
+            line_width += (space_width if line else 0) + word_width
             line.append(word)
     if line:
         lines.append(' '.join(line).strip())
     return '\n'.join(lines)
 
 
+@lru_cache(maxsize=4096)
 def dynamic_text(name: str, font_filename: str, fontsize: int, width: int, new_line: bool = False):
     name = remove_excess_spaces(name)
     if name.endswith('\n'):
@@ -0,0 +1,252 @@
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Set, Optional, Iterable, List, Tuple, Union
+
+from rm_api import DocumentCollection, Document
+
+if TYPE_CHECKING:
+    from rm_api import API
+
+LOCATION_PARENTS = (None, 'trash')
+FILE_TYPE_VIEWS = {
+    'notebook': 'notebooks',
+    'pdf': 'pdfs',
+    'epub': 'ebooks',
+}
+VIEWS = ('favorites', 'tags', *FILE_TYPE_VIEWS.values())
+
+
+def get_tags(item: Union[Document, DocumentCollection]):
+    if isinstance(item, DocumentCollection):
+        return item.tags
+    return item.content.tags
+
+
+def get_attributes(item: Union[Document, DocumentCollection]) -> Tuple[bool, bool, Optional[str]]:
+    """What decides which views the item is in"""
+    return (
+        bool(item.metadata.pinned),
+        bool(get_tags(item)),
+        item.content.file_type if isinstance(item, Document) else None
+    )
+
+
+def get_signature(item: Union[Document, DocumentCollection]) -> tuple:
+    """What the index knows about the item, the API replaces items but also changes them in place"""
+    return item, item.parent, get_attributes(item)
+
+
+class LibraryIndex:
+    """
+    Keeps the children of every parent, so navigating the library only looks at the items being shown.
+    Also keeps the items of every view, like the favorites or all the PDFs, regardless of their folder.
+    It is updated item by item from the events about them, and diffed against the API after it syncs.
+    """
+
+    def __init__(self, api: 'API'):
+        self.api = api
+        self.parents: Dict[str, Optional[str]] = {}  # Item : parent
+        self.children: Dict[Optional[str], Set[str]] = defaultdict(set)  # Parent : items
+        self.collections: Set[str] = set()
+        self.attributes: Dict[str, Tuple[bool, bool, Optional[str]]] = {}
+        self.views: Dict[str, Set[str]] = {view: set() for view in VIEWS}  # View : items
+        self._recursive_counts: Dict[str, int] = {}
+        self._fed: Dict[str, tuple] = {}  # The signatures of the items of the API, see feed
+        self.lock = threading.RLock()
+
+    def _invalidate_counts(self, parent: Optional[str]):
+        # The recursive counts of every collection above the change are outdated
+        seen = set()
+        while parent is not None and parent not in seen:
+            seen.add(parent)
+            self._recursive_counts.pop(parent, None)
+            parent = self.parents.get(parent)
+
+    def _set_views(self, uuid: str, attributes: Optional[Tuple[bool, bool, Optional[str]]]):
+        if self.attributes.get(uuid) == attributes:
+            return
+        for items in self.views.values():
+            items.discard(uuid)
+        if attributes is None:
+            self.attributes.pop(uuid, None)
+            return
+        self.attributes[uuid] = attributes
+        pinned, tagged, file_type = attributes
+        if pinned:
+            self.views['favorites'].add(uuid)
+        if tagged:
+            self.views['tags'].add(uuid)
+        if view := FILE_TYPE_VIEWS.get(file_type):
+            self.views[view].add(uuid)
+
+    def _place(self, uuid: str, parent: Optional[str], is_collection: bool):
+        if uuid in self.parents:
+            if self.parents[uuid] == parent and (uuid in self.collections) == is_collection:
+                return
+            self._remove(uuid)
+        self.parents[uuid] = parent
+        self.children[parent].add(uuid)
+        if is_collection:
+            self.collections.add(uuid)
+        self._invalidate_counts(parent)
+
+    def _remove(self, uuid: str):
+        if uuid not in self.parents:
+            return
+        parent = self.parents.pop(uuid)
+        self.children[parent].discard(uuid)
+        if not self.children[parent]:
+            del self.children[parent]
+        self.collections.discard(uuid)
+        self._set_views(uuid, None)
+        self._invalidate_counts(parent)
+        self._recursive_counts.pop(uuid, None)
+
+    def update_items(self, uuids: Iterable[str]):
+        """Update the index for just these items"""
+        with self.lock:
+            for uuid in uuids:
+                if (collection := self.api.document_collections.get(uuid)) is not None:
+                    self._place(uuid, collection.parent, True)
+                    self._set_views(uuid, get_attributes(collection))
+                elif (document := self.api.documents.get(uuid)) is not None:
+                    self._place(uuid, document.parent, False)
+                    self._set_views(uuid, get_attributes(document))
+                else:
+                    self._remove(uuid)
+
+    def sync(self):
+        """Only apply what changed in the API since the index was last synced"""
+        # Copy the document collections and documents incase they change
+        document_collections = dict(self.api.document_collections)
+        documents = dict(self.api.documents)
+        with self.lock:
+            for uuid in [uuid for uuid in self.parents if uuid not in document_collections and uuid not in documents]:
+                self._remove(uuid)
+            for uuid, collection in document_collections.items():
+                if uuid not in self.collections or self.parents[uuid] != collection.parent:
+                    self._place(uuid, collection.parent, True)
+                self._set_views(uuid, get_attributes(collection))
+            for uuid, document in documents.items():
+                if uuid not in self.parents or uuid in self.collections or self.parents[uuid] != document.parent:
+                    self._place(uuid, document.parent, False)
+                self._set_views(uuid, get_attributes(document))
+            self._fed = {
+                uuid: get_signature(item)
+                for source in (document_collections, documents) for uuid, item in source.items()
+            }
+
+    def feed(self) -> List[str]:
+        """
+        Index the items the API added, replaced, moved or removed since the last feed or sync.
+        Items are diffed by their signature, only the ones that changed are indexed again.
+        Returns the items that were indexed.
+        """
+        sources = (dict(self.api.document_collections), dict(self.api.documents))
+        items = {uuid: get_signature(item) for source in sources for uuid, item in source.items()}
+        with self.lock:
+            uuids = [uuid for uuid, _ in items.items() - self._fed.items()]
+            uuids.extend(self._fed.keys() - items.keys())
+            self._fed = items
+            self.update_items(uuids)
+        return uuids
+
+    def get_children(self, parent: Optional[str], include_orphans: bool = False) \
+            -> Tuple[Dict[str, DocumentCollection], Dict[str, Document]]:
+        """
+        The collections and documents directly within the parent.
+        Orphans are the items whose parent collection is missing, they can be shown in the root.
+        """
+        with self.lock:
+            uuids = list(self.children.get(parent, ()))
+            if include_orphans and not parent:
+                for orphan_parent, orphans in self.children.items():
+                    if orphan_parent and orphan_parent not in LOCATION_PARENTS \
+                            and orphan_parent not in self.collections:
+                        uuids.extend(orphans)
+            collection_uuids = [uuid for uuid in uuids if uuid in self.collections]
+            document_uuids = [uuid for uuid in uuids if uuid not in self.collections]
+        document_collections = {
+            uuid: collection for uuid in collection_uuids
+            if (collection := self.api.document_collections.get(uuid)) is not None
+        }
+        documents = {
+            uuid: document for uuid in document_uuids
+            if (document := self.api.documents.get(uuid)) is not None
+        }
+        return document_collections, documents
+
+    def is_orphan(self, uuid: str) -> bool:
+        """Whether the parent collection of the item is missing"""
+        parent = self.parents.get(uuid)
+        return bool(parent) and parent not in LOCATION_PARENTS and parent not in self.collections
+
+    def is_trashed(self, uuid: str) -> bool:
+        seen = set()
+        parent = self.parents.get(uuid)
+        while parent is not None and parent not in seen:
+            if parent == 'trash':
+                return True
+            seen.add(parent)
+            parent = self.parents.get(parent)
+        return False
+
+    def get_view(self, view: str) -> Tuple[Dict[str, DocumentCollection], Dict[str, Document]]:
+        """The collections and documents in the view, from every folder except the trash"""
+        with self.lock:
+            uuids = [uuid for uuid in self.views[view] if not self.is_trashed(uuid)]
+            collection_uuids = [uuid for uuid in uuids if uuid in self.collections]
+            document_uuids = [uuid for uuid in uuids if uuid not in self.collections]
+        document_collections = {
+            uuid: collection for uuid in collection_uuids
+            if (collection := self.api.document_collections.get(uuid)) is not None
+        }
+        documents = {
+            uuid: document for uuid in document_uuids
+            if (document := self.api.documents.get(uuid)) is not None
+        }
+        return document_collections, documents
+
+    def item_count(self, uuid: Optional[str]) -> int:
+        """The number of items directly within the collection"""
+        with self.lock:
+            return len(self.children.get(uuid, ()))
+
+    def is_child(self, uuid: str, parent: Optional[str]) -> bool:
+        """Whether the item is still within the parent, the API can change the parent before the index is updated"""
+        item = self.api.document_collections.get(uuid) or self.api.documents.get(uuid)
+        return item is not None and item.parent == parent
+
+    def recursive_count(self, uuid: str) -> int:
+        """The number of items within the collection and all of its sub collections"""
+        with self.lock:
+            if (count := self._recursive_counts.get(uuid)) is not None:
+                return count
+            count = 0
+            for child in self.children.get(uuid, ()):
+                if not self.is_child(child, uuid):
+                    continue
+                count += 1
+                if child in self.collections and child != uuid:
+                    count += self.recursive_count(child)
+            self._recursive_counts[uuid] = count
+            return count
+
+    def recurse(self, uuid: Optional[str]) -> List[Union[Document, DocumentCollection]]:
+        """
+        All the items within the collection and its sub collections, each collection after its items.
+        Feed the index first, so the items moved into the collection are included.
+        """
+        items = []
+        with self.lock:
+            children = self.children.get(uuid, ())
+            document_uuids = [child for child in children if child not in self.collections]
+            collection_uuids = [child for child in children if child in self.collections and child != uuid]
+        for child in document_uuids:
+            if (document := self.api.documents.get(child)) is not None and document.parent == uuid:
+                items.append(document)
+        for child in collection_uuids:
+            if (collection := self.api.document_collections.get(child)) is not None and collection.parent == uuid:
+                items.extend(self.recurse(child))
+                items.append(collection)
+        return items
@@ -1,7 +1,8 @@
 from typing import Literal
 
 MAIN_MENU_MODES = Literal['grid', 'list', 'compressed', 'folder']
-MAIN_MENU_LOCATIONS = Literal['my_files', 'trash']
+MAIN_MENU_LOCATIONS = Literal['my_files', 'trash', 'favorites', 'tags', 'notebooks', 'pdfs', 'ebooks']
+MAIN_MENU_SORTING_MODES = Literal['name', 'created', 'last_modified', 'last_opened', 'page_count', 'size']
 PDF_RENDER_MODES = Literal['cef', 'pymupdf', 'none', 'retry']  # CEF is deprecated
 NOTEBOOK_RENDER_MODES = Literal[
     'rm_lines_svg_inker_OLD', 'librm_lines_renderer', 'retry']  # rm_lines_svg_inker is deprecated
@@ -189,6 +189,9 @@ class ContextBar(pe.ChildContext, ABC):
     def currently_inverted(self):
         return None
 
+    def is_inverted(self, inverted_id) -> bool:
+        return inverted_id == self.currently_inverted
+
     def pre_loop(self):
         if not self.initialized:
             self.handle_scales()
@@ -209,7 +212,7 @@ class ContextBar(pe.ChildContext, ABC):
                 button_text.rect.move_ip(x_offset, y_offset)
                 button_text_inverted.rect.move_ip(x_offset, y_offset)
             if inverted_id := button_meta.get('inverted_id'):
-                is_inverted = (self.INVERT or inverted_id == self.currently_inverted)
+                is_inverted = (self.INVERT or self.is_inverted(inverted_id))
             else:
                 is_inverted = self.INVERT
             if is_inverted:
@@ -1,16 +1,24 @@
 import os.path
 import threading
+import time
+from collections import OrderedDict, deque
+from hashlib import sha1
+from io import BytesIO
 from traceback import print_exc
-from typing import Dict, Tuple, List, Optional
+from typing import Dict, Tuple, Optional, Union, Deque
 
 import pygameextra as pe
 from rm_api import Document
-from rm_api.models import Page
+from rm_api.models import Page, File
 from rm_api.storage.common import FileHandle
-from rm_api.storage.v3 import get_file_contents, check_file_exists, CacheMiss
+from rm_api.storage.v3 import get_file_contents, check_file_exists
+from rm_lines import rm_bytes_to_svg
 
 from gui.defaults import Defaults
-from gui.screens.viewer.renderers.notebook.rm_lines_svg_inker import Notebook_rM_Lines_Renderer
+from gui.preview_metrics import PreviewMetrics
+from gui.preview_scheduler import PreviewScheduler, PreviewTask
+from gui.thumbnail_store import ThumbnailStore
+from gui.screens.viewer.renderers.notebook.rm_lines_svg_inker import rM_Lines_ExpandedNotebook
 
 try:
     import pymupdf
@@ -18,148 +26,446 @@ except ImportError:
     pymupdf = None
 
 
+PreviewEntry = Tuple[str, Optional[Union[pe.Sprite, pe.Image]]]
+
+
+class PreviewCache:
+    """
+    A least recently used cache for previews which is limited by the memory size of the surfaces it holds.
+    Evicted previews are not lost, they get loaded back from the thumbnail files when needed again.
+    Each preview also keeps the scaled copies it was displayed at, they are counted towards the same budget.
+    """
+    BYTES_PER_PIXEL = 4  # Previews are always stored as RGBA surfaces
+
+    def __init__(self):
+        self.entries: OrderedDict[str, PreviewEntry] = OrderedDict()
+        self.sizes: Dict[str, int] = {}
+        self.variants: Dict[str, Dict[Tuple[int, int], pe.Image]] = {}
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.RLock()
+
+    @property
+    def budget(self) -> int:
+        return int(pe.settings.config.preview_cache_budget_mb * 1024 * 1024)
+
+    @classmethod
+    def calculate_size(cls, preview: Optional[Union[pe.Sprite, pe.Image]]) -> int:
+        if preview is None:
+            return 0
+        if isinstance(preview, pe.Sprite):
+            width, height = preview.reference.size
+        else:
+            width, height = preview.size
+        return int(width * height * cls.BYTES_PER_PIXEL)
+
+    def get(self, document_id: str, default=None) -> Optional[PreviewEntry]:
+        with self.lock:
+            entry = self.entries.get(document_id)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(document_id)
+            self.hits += 1
+            return entry
+
+    def __getitem__(self, document_id: str) -> PreviewEntry:
+        if (entry := self.get(document_id)) is None:
+            raise KeyError(document_id)
+        return entry
+
+    def __setitem__(self, document_id: str, entry: PreviewEntry):
+        size = self.calculate_size(entry[1])
+        with self.lock:
+            self.pop(document_id, None)
+            self.entries[document_id] = entry
+            self.sizes[document_id] = size
+            self.used += size
+            self.evict(keep=document_id)
+
+    def __contains__(self, document_id: str):
+        return document_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def pop(self, document_id: str, default=None) -> Optional[PreviewEntry]:
+        with self.lock:
+            entry = self.entries.pop(document_id, None)
+            if entry is None:
+                return default
+            self.used -= self.sizes.pop(document_id, 0)
+            self.variants.pop(document_id, None)
+            return entry
+
+    def get_variant(self, document_id: str, size: Tuple[int, int]) -> Optional[pe.Image]:
+        with self.lock:
+            return self.variants.get(document_id, {}).get(size)
+
+    def set_variant(self, document_id: str, size: Tuple[int, int], variant: pe.Image):
+        with self.lock:
+            if document_id not in self.entries:
+                return
+            variant_size = self.calculate_size(variant)
+            self.variants.setdefault(document_id, {})[size] = variant
+            self.sizes[document_id] += variant_size
+            self.used += variant_size
+            self.evict(keep=document_id)
+
+    def evict(self, keep: str = None):
+        with self.lock:
+            budget = self.budget
+            while self.used > budget and len(self.entries) > 1:
+                document_id = next(iter(self.entries))
+                if document_id == keep:
+                    # Never evict the preview that is being added
+                    self.entries.move_to_end(document_id)
+                    continue
+                self.pop(document_id)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.variants.clear()
+            self.used = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self.entries),
+            'variants': sum(len(variants) for variants in self.variants.values()),
+            'used': self.used,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class PDFHandlePool:
+    """
+    Keeps the most recently used PDFs open, keyed by their file hash.
+    The PDFs are opened straight from the sync cache, so their contents are never read into memory by us.
+    Only use it while holding the PyMuPDF lock.
+    """
+    MAX_HANDLES = 8
+
+    def __init__(self):
+        self.handles: OrderedDict[str, 'pymupdf.Document'] = OrderedDict()
+
+    def get(self, document: Document, pdf_file: File) -> Optional['pymupdf.Document']:
+        if pdf := self.handles.get(pdf_file.hash):
+            self.handles.move_to_end(pdf_file.hash)
+            return pdf
+
+        if document.api.sync_file_path and \
+                os.path.isfile(location := os.path.join(document.api.sync_file_path, pdf_file.hash)):
+            pdf = pymupdf.open(location, filetype='pdf')
+        elif stream := document.content_data.get(pdf_file.uuid):
+            # The PDF was not synced yet, but the document already holds it
+            if isinstance(stream, FileHandle):
+                pdf = pymupdf.open(stream.file_path, filetype='pdf')
+            else:
+                pdf = pymupdf.open(stream=stream, filetype='pdf')
+        else:
+            return None
+
+        self.handles[pdf_file.hash] = pdf
+        while len(self.handles) > self.MAX_HANDLES:
+            _, oldest = self.handles.popitem(last=False)
+            oldest.close()
+        return pdf
+
+    def clear(self):
+        for pdf in self.handles.values():
+            pdf.close()
+        self.handles.clear()
+
+
+class PreviewSources:
+    """
+    The files a document preview is rendered from.
+    The preview key is made from the hashes of these files and the preview size,
+    so a preview becomes outdated as soon as its content changes and identical content shares a thumbnail.
+    """
+
+    def __init__(self, document: Document):
+        try:
+            if document.content.cover_page_number == -1:
+                self.page_id = document.content.c_pages.last_opened.value
+            else:
+                self.page_id = document.content.c_pages.pages[0].id
+        except:
+            self.page_id = 'index-error'
+
+        file_uuid = f'{document.uuid}/{self.page_id}.rm'
+        self.rm_file: Optional[File] = document.files_available.get(file_uuid)
+        if not self.rm_file and pe.settings.config.download_last_opened_page_to_make_preview:
+            self.rm_file = next((file for file in document.files if file.uuid == file_uuid), None)
+
+        self.page: Optional[Page] = None
+        self.pdf_file: Optional[File] = None
+        if document.content.file_type in ('pdf', 'epub'):
+            if self.page_id == 'index-error':
+                self.page = Page.new_pdf_redirect(0, 'index-error', 'index-error')
+            else:
+                self.page = document.content.c_pages.get_page_from_uuid(self.page_id)
+            if self.page and self.page.redirect:
+                self.pdf_file = document.files_available.get(f'{document.uuid}.pdf')
+
+        self.legacy_name = f'{document.uuid}.{self.page_id}'  # The name of the thumbnail before the keys
+        self.key = self.make_key(
+            self.rm_file.hash if self.rm_file else None,
+            self.pdf_file.hash if self.pdf_file else None,
+            self.page.redirect.value if self.pdf_file else None,
+        )
+
+    @staticmethod
+    def make_key(rm_hash: Optional[str], pdf_hash: Optional[str], pdf_page: Optional[int]) -> str:
+        source = f'{rm_hash}:{pdf_hash}:{pdf_page}:{Defaults.PREVIEW_SIZE[0]}x{Defaults.PREVIEW_SIZE[1]}'
+        return sha1(source.encode()).hexdigest()
+
+
 class PreviewHandler:
-    # Document id : (page id, sprite)
-    # Sprite just allows for easy resizing
-    CACHED_PREVIEW: Dict[str, Tuple[str, Optional[pe.Sprite]]] = {}
-    PREVIEW_LOAD_TASKS: List[str] = []
-    PYGAME_THREAD_LOCK = threading.Lock()
-    TASK_LOCK = threading.Lock()
+    # Document id : (preview key, sprite)
+    # The sprite keeps the full size preview, scaled copies are kept as variants
+    CACHED_PREVIEW = PreviewCache()
+    THUMBNAILS = ThumbnailStore(Defaults.THUMB_FILE_PATH)
+    READY: Deque[Tuple[str, str, Tuple[int, int], bytes]] = deque()  # Decoded previews waiting for the main thread
+    PYMUPDF_LOCK = threading.Lock()  # PyMuPDF is not thread safe
+    PDF_HANDLES = PDFHandlePool()
+    METRICS = PreviewMetrics()
+    SCHEDULER = PreviewScheduler(lambda task: PreviewHandler.handle_loading_task(task))
 
     @classmethod
-    def get_preview(cls, document: Document, size: Tuple[int, int]) -> Optional[pe.Sprite]:
-        size = tuple(min(given, max) for given, max in zip(size, Defaults.PREVIEW_SIZE))
+    def get_preview(cls, document: Document, size: Tuple[int, int], priority: float = 0) -> Optional[pe.Image]:
+        size = tuple(int(min(given, max)) for given, max in zip(size, Defaults.PREVIEW_SIZE))
         try:
-            sprite = cls._get_preview(document)
+            preview = cls._get_preview(document, priority)
         except:
             print_exc()
-            sprite = None
-        if sprite is None:
+            preview = None
+        if preview is None:
             return None
-        sprite.resize = size
-        return sprite
+        # The document size only changes with the view scale, so each preview is scaled once per scale
+        if (variant := cls.CACHED_PREVIEW.get_variant(document.uuid, size)) is None:
+            variant = cls.scale_preview(preview, size)
+            cls.CACHED_PREVIEW.set_variant(document.uuid, size, variant)
+        return variant
+
+    @staticmethod
+    def scale_preview(preview: Union[pe.Sprite, pe.Image], size: Tuple[int, int]) -> pe.Image:
+        surface = preview.reference if isinstance(preview, pe.Sprite) else preview.surface
+        if surface.size == size:
+            return pe.Image(surface)
+        return pe.Image(pe.Surface(size, surface=pe.pygame.transform.smoothscale(surface.surface, size)))
 
     @classmethod
-    def _get_preview(cls, document: Document) -> Optional[pe.Sprite]:
+    def prefetch(cls, document: Document, priority: float):
+        # Queue the preview without using it, for documents which are not visible yet
         try:
-            if document.content.cover_page_number == -1:
-                page_id = document.content.c_pages.last_opened.value
-            else:
-                page_id = document.content.c_pages.pages[0].id
+            cls._get_preview(document, priority)
         except:
-            page_id = 'index-error'
+            print_exc()
+
+    @classmethod
+    def _get_preview(cls, document: Document, priority: float = 0) -> Optional[pe.Sprite]:
+        sources = PreviewSources(document)
         document_id = document.uuid
-        loading_task = f'{document_id}.{page_id}'
-        location = os.path.join(Defaults.THUMB_FILE_PATH, f'{loading_task}.png')
-        if preview := cls.CACHED_PREVIEW.get(document_id):
-            if preview[0] == page_id:
-                if os.path.isdir(Defaults.THUMB_FILE_PATH):
-                    if not document.provision and preview[1] and not os.path.exists(location):
-                        preview[1].get_finished_surface().save_to_file(location)
-                return preview[1]
-        # If the preview is not cached, load it
-        if os.path.exists(location):
-            with PreviewHandler.PYGAME_THREAD_LOCK:
-                sprite = pe.Sprite(location)
-            cls.CACHED_PREVIEW[document_id] = (page_id, sprite)
-            return cls._get_preview(document)
-
-        # Prevent multiple of the same task
-        if loading_task in cls.PREVIEW_LOAD_TASKS:
-            return None
+        preview = cls.CACHED_PREVIEW.get(document_id)
+        if preview and preview[0] == sources.key:
+            if cls.THUMBNAILS.available:
+                if not document.provision and preview[1] and sources.key not in cls.THUMBNAILS:
+                    cls.save_preview(preview[1], sources.key)
+            return preview[1]
 
-        # Create a new loading task
-        cls.PREVIEW_LOAD_TASKS.append(loading_task)
-        threading.Thread(target=cls.handle_loading_task, args=(loading_task, document, page_id), daemon=True).start()
+        if preview:
+            cls.METRICS.count('outdated')
+        # Queue a loading task, or update the priority of the existing one
+        # The task decodes the saved thumbnail if there is one, otherwise it renders the preview
+        cls.SCHEDULER.submit(sources.key, document, sources, priority)
+
+        # Keep showing the outdated preview until the new one is ready
+        return preview[1] if preview else None
 
     @classmethod
-    def handle_loading_task(cls, loading_task, document: Document, page_id: str):
+    def handle_loading_task(cls, task: PreviewTask):
+        cls.METRICS.record('queue_wait', time.perf_counter() - task.queued_at)
         try:
-            with cls.TASK_LOCK:
-                cls._handle_loading_task(document, page_id)
+            cls._handle_loading_task(task.document, task.sources)
         except:
             print_exc()
-            cls.CACHED_PREVIEW[document.uuid] = (page_id, None)
-        finally:
-            cls.PREVIEW_LOAD_TASKS.remove(loading_task)
+            cls.METRICS.count('failures')
+            cls.CACHED_PREVIEW[task.document.uuid] = (task.sources.key, None)
 
     @classmethod
-    def _handle_loading_task(cls, document: Document, page_id: str):
-        file = document.files_available.get(file_uuid := f'{document.uuid}/{page_id}.rm')
+    def _handle_loading_task(cls, document: Document, sources: 'PreviewSources'):
+        data = cls.THUMBNAILS.read(sources.key)
+        if data is None:
+            data = cls.THUMBNAILS.migrate_legacy(sources.key, sources.legacy_name)
+        if data is not None:
+            try:
+                with cls.METRICS.measure('thumbnail_decode'):
+                    image = pe.pygame.image.load(BytesIO(data), 'png')
+            except pe.pygame.error:
+                # The thumbnail is broken, render it again
+                cls.THUMBNAILS.discard(sources.key)
+            else:
+                cls.METRICS.count('thumbnail_hits')
+                cls.queue_upload(document.uuid, sources.key, image)
+                return
 
-        base_img: pe.Surface = None
+        base_img: Optional[pe.pygame.Surface] = None
 
-        if document.content.file_type in ('pdf', 'epub'):
-            if page_id == 'index-error':
-                page = Page.new_pdf_redirect(0, 'index-error', 'index-error')
-            else:
-                page = document.content.c_pages.get_page_from_uuid(page_id)
-
-            if page and page.redirect:
-                pdf_file = document.files_available.get(f'{document.uuid}.pdf')
-                try:
-                    document.load_files_from_cache()
-                except CacheMiss:
-                    cls.CACHED_PREVIEW[document.uuid] = (page_id, None)
+        if sources.pdf_file and pymupdf:
+            with cls.PYMUPDF_LOCK:
+                pdf = cls.PDF_HANDLES.get(document, sources.pdf_file)
+                if pdf is None:
+                    cls.METRICS.count('unavailable')
+                    cls.CACHED_PREVIEW[document.uuid] = (sources.key, None)
                     return
+                base_img = cls.render_pdf_page(pdf, sources.page.redirect.value)
 
-                if pdf_file and (stream := document.content_data.get(pdf_file.uuid)) and pymupdf:
-                    if isinstance(stream, FileHandle):
-                        pdf = pymupdf.open(stream.file_path, filetype='pdf')
-                    else:
-                        pdf = pymupdf.open(
-                            stream=stream,
-                            filetype='pdf'
-                        )
-
-                    pdf_page = pdf[page.redirect.value]
-
-                    scale_x = Defaults.PREVIEW_SIZE[0] / pdf_page.rect.width
-                    scale_y = Defaults.PREVIEW_SIZE[1] / pdf_page.rect.height
-                    matrix = pymupdf.Matrix(scale_x, scale_y)
-
-                    # noinspection PyUnresolvedReferences
-                    pix = pdf_page.get_pixmap(matrix=matrix)
-                    mode = "RGBA" if pix.alpha else "RGB"
-                    # noinspection PyTypeChecker
-                    with PreviewHandler.PYGAME_THREAD_LOCK:
-                        base_img = pe.Surface(
-                            surface=pe.pygame.image.frombuffer(pix.samples, (pix.width, pix.height), mode))
-
-        if not document.provision:
-            document.unload_files()
-
-        file_hash = None
-        if not file:
-            if pe.settings.config.download_last_opened_page_to_make_preview:
-                for file in document.files:
-                    if file.uuid == file_uuid:
-                        file_hash = file.hash
-                        break
-        else:
-            file_hash = file.hash
+        file_hash = sources.rm_file.hash if sources.rm_file else None
         if file_hash and check_file_exists(document.api, file_hash):
-            rm_bytes = get_file_contents(document.api, file_hash, binary=True)
+            with cls.METRICS.measure('get_file_contents'):
+                rm_bytes = get_file_contents(document.api, file_hash, binary=True)
             if not rm_bytes:
                 raise Exception('Page content unavailable to construct preview')
-            notebook = Notebook_rM_Lines_Renderer.generate_expanded_notebook_from_rm(
-                document, rm_bytes,
-                use_lock=cls.PYGAME_THREAD_LOCK,
-            )
-            if notebook is None:
-                raise Exception('Failed to create expanded notebook to render preview')
-            image = notebook.get_frame_from_initial(0, 0, *Defaults.PREVIEW_SIZE)
+            image = cls.render_notebook_page(document, rm_bytes)
         else:
             image = None
 
+        with cls.METRICS.measure('compose'):
+            image = cls.compose_preview(base_img, image)
+
+        if image and not document.provision and cls.THUMBNAILS.available:
+            # Save the preview right away, so it can be loaded back if it gets evicted from the cache
+            with cls.METRICS.measure('disk_write'):
+                cls.save_preview(image, sources.key)
+
+        if image:
+            cls.METRICS.count('rendered')
+            cls.queue_upload(document.uuid, sources.key, image)
+        else:
+            cls.CACHED_PREVIEW[document.uuid] = (sources.key, None)
+
+    # The rendering below only uses plain pygame surfaces which are never converted,
+    # this keeps it safe to run outside the main thread without holding the pygame lock
+
+    @classmethod
+    def render_pdf_page(cls, pdf: 'pymupdf.Document', page_index: int) -> pe.pygame.Surface:
+        with cls.METRICS.measure('pymupdf_render'):
+            return cls._render_pdf_page(pdf, page_index)
+
+    @staticmethod
+    def _render_pdf_page(pdf: 'pymupdf.Document', page_index: int) -> pe.pygame.Surface:
+        pdf_page = pdf[page_index]
+
+        scale_x = Defaults.PREVIEW_SIZE[0] / pdf_page.rect.width
+        scale_y = Defaults.PREVIEW_SIZE[1] / pdf_page.rect.height
+        matrix = pymupdf.Matrix(scale_x, scale_y)
+
+        # Rasterize straight to the preview size, pages are opaque so skip the alpha channel
+        # noinspection PyUnresolvedReferences
+        pix = pdf_page.get_pixmap(matrix=matrix, alpha=False, clip=pdf_page.rect)
+        return pe.pygame.image.frombytes(pix.samples, (pix.width, pix.height), "RGB")
+
+    @classmethod
+    def render_notebook_page(cls, document: Document, rm_bytes: bytes) -> pe.pygame.Surface:
+        with cls.METRICS.measure('expanded_notebook'):
+            svg, track_xy = rm_bytes_to_svg(rm_bytes, document)
+            notebook = rM_Lines_ExpandedNotebook(svg, track_xy)
+        with cls.METRICS.measure('notebook_render'):
+            frame = notebook.get_frame_svg(0, 0, *Defaults.PREVIEW_SIZE)
+            return pe.pygame.image.load(BytesIO(frame), 'svg')
+
+    @staticmethod
+    def compose_preview(base_img: Optional[pe.pygame.Surface],
+                        image: Optional[pe.pygame.Surface]) -> Optional[pe.pygame.Surface]:
+        # Stamp the notebook lines on top of the PDF page
         if base_img:
             if image:
-                base_img.stamp(image.reference)
-                image.reference = base_img
-            else:
-                image = pe.Sprite(base_img)
+                base_img.blit(image, (0, 0))
+            return base_img
+        return image
+
+    @classmethod
+    def queue_upload(cls, document_id: str, key: str, image: pe.pygame.Surface):
+        # The raw pixels are turned into a sprite by the main thread, see upload_ready
+        cls.READY.append((document_id, key, image.get_size(), pe.pygame.image.tobytes(image, 'RGBA')))
+        if pe.settings.game_context:
+            pe.settings.game_context.invalidate()
 
-        cls.CACHED_PREVIEW[document.uuid] = (page_id, image)
+    @classmethod
+    def upload_ready(cls):
+        """
+        Turn the decoded previews into sprites, this is called by the main thread every frame.
+        Stops once the frame's time budget is used up, so lots of previews finishing together don't cause a hitch.
+        """
+        if not cls.READY:
+            return
+        budget = pe.settings.config.preview_upload_budget_ms / 1000
+        started = time.perf_counter()
+        while cls.READY:
+            document_id, key, size, pixels = cls.READY.popleft()
+            upload_started = time.perf_counter()
+            surface = pe.pygame.image.frombuffer(pixels, size, 'RGBA').convert_alpha()
+            cls.CACHED_PREVIEW[document_id] = (key, pe.Sprite(pe.Surface(size, surface=surface)))
+            cls.METRICS.record('upload', (now := time.perf_counter()) - upload_started)
+            if now - started >= budget:
+                break
+
+    @classmethod
+    def encode_preview(cls, preview: Union[pe.Sprite, pe.Image, pe.pygame.Surface]) -> bytes:
+        # Encode the full size reference rather than the currently resized surface
+        if isinstance(preview, pe.Sprite):
+            surface = preview.reference.surface
+        elif isinstance(preview, pe.Image):
+            surface = preview.surface.surface
+        else:
+            surface = preview
+        with BytesIO() as buffer:
+            pe.pygame.image.save(surface, buffer, 'png')
+            return buffer.getvalue()
+
+    @classmethod
+    def save_preview(cls, preview: Union[pe.Sprite, pe.Image, pe.pygame.Surface], key: str):
+        cls.THUMBNAILS.write(key, cls.encode_preview(preview))
+
+    @classmethod
+    def collect_garbage(cls, documents: Dict[str, Document]) -> int:
+        """Remove the thumbnails which no document refers to anymore, returns how many were removed"""
+        if not documents or not cls.THUMBNAILS.available:
+            return 0
+        referenced = set()
+        for document in list(documents.values()):
+            try:
+                referenced.add(PreviewSources(document).key)
+            except:
+                # Keep every thumbnail if the library can't be fully checked
+                print_exc()
+                return 0
+        removed = 0
+        for key in cls.THUMBNAILS.keys():
+            if key not in referenced:
+                cls.THUMBNAILS.discard(key)
+                removed += 1
+        cls.THUMBNAILS.compact_if_fragmented()
+        return removed
+
+    @classmethod
+    def dump_metrics(cls, file_path: str):
+        cls.METRICS.dump(
+            file_path,
+            cache=cls.CACHED_PREVIEW.stats,
+            thumbnails=cls.THUMBNAILS.stats,
+            scheduler={'queued': cls.SCHEDULER.queued, 'running': cls.SCHEDULER.running},
+        )
 
     @classmethod
     def clear_for(cls, document_uuid: str, callback=None):
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, Deque, Any
+
+
+class StageTimings:
+    SAMPLES = 500  # Recent samples kept for the percentiles
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=self.SAMPLES)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.samples:
+            return 0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0,
+            'p50_ms': self.percentile(.5) * 1000,
+            'p95_ms': self.percentile(.95) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class PreviewMetrics:
+    """
+    Timings for every stage of the preview pipeline, and counters for how previews were served.
+    Shown in the document view when debugging, and exported with the debug statistics.
+    """
+    STAGES = (
+        'queue_wait',  # From being requested until a worker picks the task up
+        'thumbnail_decode',
+        'get_file_contents',
+        'expanded_notebook',  # Converting the .rm file to an SVG notebook
+        'notebook_render',  # Rasterizing the notebook SVG
+        'pymupdf_render',
+        'compose',
+        'disk_write',
+        'upload',  # Turning the decoded preview into a sprite on the main thread
+    )
+
+    def __init__(self):
+        self.stages: Dict[str, StageTimings] = {stage: StageTimings() for stage in self.STAGES}
+        self.counters = Counter()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            self.stages[stage].add(seconds)
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, counter: str, amount: int = 1):
+        with self.lock:
+            self.counters[counter] += amount
+
+    def reset(self):
+        with self.lock:
+            self.stages = {stage: StageTimings() for stage in self.STAGES}
+            self.counters.clear()
+            self.started = time.time()
+
+    def to_dict(self, **extra) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'started': self.started,
+                'duration': time.time() - self.started,
+                'stages': {stage: timings.to_dict() for stage, timings in self.stages.items()},
+                'counters': dict(self.counters),
+                **extra
+            }
+
+    def dump(self, file_path: str, **extra):
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(**extra), f, indent=4)
+
+    @property
+    def overlay_text(self) -> str:
+        with self.lock:
+            stages = ' | '.join(
+                f"{stage} {timings.percentile(.5) * 1000:.1f}/{timings.percentile(.95) * 1000:.1f}ms"
+                for stage, timings in self.stages.items() if timings.count
+            )
+            counters = ' | '.join(f"{counter}: {value}" for counter, value in sorted(self.counters.items()))
+        return f"{counters} || p50/p95 {stages}" if stages else counters
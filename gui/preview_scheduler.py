@@ -0,0 +1,119 @@
+import threading
+import time
+from heapq import heappush, heappop
+from itertools import count
+from traceback import print_exc
+from typing import Dict, List, Tuple, Callable, Optional, TYPE_CHECKING
+
+import pygameextra as pe
+
+if TYPE_CHECKING:
+    from rm_api import Document
+    from gui.preview_handler import PreviewSources
+
+
+class PreviewTask:
+    def __init__(self, key: str, document: 'Document', sources: 'PreviewSources', priority: float, generation: int,
+                 sequence: int):
+        self.key = key
+        self.document = document
+        self.sources = sources
+        self.priority = priority
+        self.generation = generation  # The last frame this task was requested on
+        self.sequence = sequence  # Keeps the order of tasks with the same priority
+        self.queued_at = time.perf_counter()
+        self.running = False
+
+
+class PreviewScheduler:
+    """
+    A fixed size pool of worker threads which generate previews by priority.
+    Lower priority values are handled first, the document viewers use the distance from the visible area.
+    Queued tasks which are no longer requested by the time a frame ends get cancelled.
+    """
+
+    def __init__(self, handler: Callable[[PreviewTask], None]):
+        self.handler = handler
+        self.tasks: Dict[str, PreviewTask] = {}  # Both queued and running tasks
+        self.queue: List[Tuple[float, int, str]] = []
+        self.condition = threading.Condition()
+        self.sequence = count()
+        self.generation = 0
+        self.workers: List[threading.Thread] = []
+
+    @property
+    def worker_count(self) -> int:
+        return max(1, int(pe.settings.config.preview_workers))
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for task in self.tasks.values() if not task.running)
+
+    @property
+    def running(self) -> int:
+        return sum(1 for task in self.tasks.values() if task.running)
+
+    def __contains__(self, key: str):
+        return key in self.tasks
+
+    def submit(self, key: str, document: 'Document', sources: 'PreviewSources', priority: float = 0):
+        with self.condition:
+            if task := self.tasks.get(key):
+                task.generation = self.generation
+                if not task.running and task.priority != priority:
+                    # Requeue with the new priority, the outdated queue entry gets skipped
+                    task.priority = priority
+                    task.sequence = next(self.sequence)
+                    heappush(self.queue, (priority, task.sequence, key))
+                return
+            task = PreviewTask(key, document, sources, priority, self.generation, next(self.sequence))
+            self.tasks[key] = task
+            heappush(self.queue, (priority, task.sequence, key))
+            self.ensure_workers()
+            self.condition.notify()
+
+    def cancel(self, key: str):
+        with self.condition:
+            if (task := self.tasks.get(key)) and not task.running:
+                del self.tasks[key]
+
+    def new_frame(self):
+        with self.condition:
+            self.generation += 1
+
+    def cancel_stale(self):
+        """Cancel every queued task that was not requested since the last new frame"""
+        with self.condition:
+            for key, task in list(self.tasks.items()):
+                if not task.running and task.generation < self.generation:
+                    del self.tasks[key]
+
+    def ensure_workers(self):
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        for _ in range(self.worker_count - len(self.workers)):
+            worker = threading.Thread(target=self.work, daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def next_task(self) -> Optional[PreviewTask]:
+        while self.queue:
+            priority, sequence, key = heappop(self.queue)
+            task = self.tasks.get(key)
+            if task is None or task.running or task.sequence != sequence:
+                continue  # Cancelled or requeued with a different priority
+            return task
+        return None
+
+    def work(self):
+        while True:
+            with self.condition:
+                while (task := self.next_task()) is None:
+                    self.condition.wait()
+                task.running = True
+            try:
+                self.handler(task)
+            except:
+                print_exc()
+            finally:
+                with self.condition:
+                    self.tasks.pop(task.key, None)
@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import TYPE_CHECKING, Dict, Tuple, Optional
+from typing import TYPE_CHECKING, Dict, Tuple, Optional, List
 
 import pygameextra as pe
 from humanize import naturalsize
@@ -126,9 +126,23 @@ def open_document_debug_menu(gui: 'GUI', document: 'Document', position):
     DocumentDebugPopup.create(gui, document, position)()
 
 
+SCALED_ICONS: Dict[Tuple[str, float], Tuple[pe.Image, pe.Image]] = {}  # (Icon key, scale) : (icon, scaled icon)
+
+
+def get_scaled_icon(gui: 'GUI', icon_key: str, scale: float) -> pe.Image:
+    # Scale the icon once per scale rather than every frame, the icons get replaced when reloading the theme
+    icon = gui.icons[icon_key]
+    cached = SCALED_ICONS.get(key := (icon_key, round(scale, 2)))
+    if cached is None or cached[0] is not icon:
+        scaled_icon = icon.copy()
+        scaled_icon.resize(tuple(v * scale for v in icon.size))
+        SCALED_ICONS[key] = cached = (icon, scaled_icon)
+    return cached[1]
+
+
 def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
                     document_sync_operation: DocumentSyncProgress = None, scale=1, select_document=None,
-                    selected: bool = False):
+                    selected: bool = False, preview_priority: float = 0):
     # Prepare edge rounding and all the texts
     edge_rounding = int(gui.ratios.main_menu_document_rounding * rect.width)
     inverse_key = '_inverted' if selected else ''
@@ -218,10 +232,10 @@ def render_document(gui: 'GUI', rect: pe.Rect, texts, document: 'Document',
         sub_text.display()
 
     # Render the notebook icon if there is no preview
-    preview = PreviewHandler.get_preview(document, rect.size) if gui.loader.files_to_load is None else None
+    preview = PreviewHandler.get_preview(document, rect.size, preview_priority) \
+        if gui.loader.files_to_load is None else None
     if not preview:
-        notebook_large: pe.Image = gui.icons['notebook_large'].copy()
-        notebook_large.resize(tuple(v * scale for v in notebook_large.size))
+        notebook_large = get_scaled_icon(gui, 'notebook_large', scale)
         notebook_large_rect = pe.Rect(0, 0, *notebook_large.size)
         notebook_large_rect.center = rect.center
         notebook_large.display(notebook_large_rect.topleft)
@@ -372,10 +386,14 @@ def render_button_using_text(
     return rect
 
 
-def render_header(gui: 'GUI', texts: Dict[str, pe.Text], callback, path_queue: 'Queue'):
+def get_header_layout(gui: 'GUI', texts: Dict[str, pe.Text], path_queue: 'Queue') \
+        -> Optional[Tuple[List[Tuple[int, int]], List[Tuple[str, Tuple[int, int]]]]]:
+    """
+    The positions of the chevrons and the path texts next to the header.
+    Returns None if the window is too small to render the path
+    """
     menu_location = gui.main_menu.menu_location
-
-    render_button_using_text(gui, texts[menu_location], action=callback, name='main_menu.header')
+    chevron = gui.icons['chevron_right']
 
     x = texts[menu_location].rect.right + gui.ratios.main_menu_path_padding
     y = texts[menu_location].rect.centery
@@ -386,33 +404,59 @@ def render_header(gui: 'GUI', texts: Dict[str, pe.Text], callback, path_queue: '
     # Calculate the width of the path
     for item in path_queue.queue:
         text_key = f'path_{item}'
-        width += gui.icons['chevron_right'].width + texts[text_key].rect.width
+        width += chevron.width + texts[text_key].rect.width
 
     # Calculate the number of items to skip in the path, this results in the > > you see in the beginning
-    while width > gui.width - (x + 200):
+    # Leaving room for the search field
+    while width > gui.width - (x + max(200, gui.ratios.main_menu_search_width + gui.ratios.main_menu_x_padding * 2)):
         skips += 1
         if len(path_queue.queue) - skips <= 0:
-            # window is too small to render the path
-            return
+            return None
         width -= texts[f'path_{path_queue.queue[-skips]}'].rect.width
 
-    # Draw the path
+    chevrons = []
+    path_texts = []
     for i, item in enumerate(reversed(path_queue.queue)):
-        text_key = f'path_{item}'
-
-        # Draw the arrow
+        # Place the arrow
         if i >= skips or i < 1:  # Making sure to render the arrow only for the first skip, making sure to avoid > > > >
-            gui.icons['chevron_right'].display((x, y - gui.icons['chevron_right'].height // 2))
+            chevrons.append((x, y - chevron.height // 2))
 
-            x += gui.icons['chevron_right'].width
+            x += chevron.width
             if i == 0:
                 x += gui.ratios.main_menu_path_first_padding
 
-        # Draw the text only if it's not skipped
+        # Place the text only if it's not skipped
         if i >= skips:
-            texts[text_key].rect.midleft = (x, y)
-            render_button_using_text(gui, texts[text_key], action=callback, data=item, name=f'main_menu.path={item}')
-            x += texts[text_key].rect.width
+            path_texts.append((item, (x, y)))
+            x += texts[f'path_{item}'].rect.width
+    return chevrons, path_texts
+
+
+def render_header(gui: 'GUI', texts: Dict[str, pe.Text], callback, path_queue: 'Queue'):
+    main_menu = gui.main_menu
+    menu_location = main_menu.menu_location
+
+    render_button_using_text(gui, texts[menu_location], action=callback, name='main_menu.header')
+
+    # The layout only changes when navigating, resizing or when the texts change, like with the language
+    key = (
+        menu_location, tuple(path_queue.queue), gui.width, gui.config.language,
+        texts[menu_location].text, tuple(texts[f'path_{item}'].text for item in path_queue.queue)
+    )
+    if main_menu.header_layout is None or main_menu.header_layout[0] != key:
+        main_menu.header_layout = (key, get_header_layout(gui, texts, path_queue))
+    if (layout := main_menu.header_layout[1]) is None:
+        # window is too small to render the path
+        return
+    chevrons, path_texts = layout
+
+    # Draw the path
+    for position in chevrons:
+        gui.icons['chevron_right'].display(position)
+    for item, midleft in path_texts:
+        text_key = f'path_{item}'
+        texts[text_key].rect.midleft = midleft
+        render_button_using_text(gui, texts[text_key], action=callback, data=item, name=f'main_menu.path={item}')
 
 
 @lru_cache
@@ -435,6 +479,7 @@ def draw_bottom_loading_bar(
         finish: bool = False, stage: int = STAGE_SYNC,
         is_bytes: bool = False,
 ):
+    gui.invalidate()  # The progress keeps changing while the bar is shown
     draw_bottom_bar(gui)
     bottom_bar_rect = get_bottom_bar_rect(gui)
     loading_bar_rect = pe.Rect(0, 0, gui.ratios.bottom_loading_bar_width, gui.ratios.bottom_loading_bar_height)
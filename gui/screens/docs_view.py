@@ -1,6 +1,7 @@
 from abc import abstractmethod, ABC
-from math import ceil
-from typing import TYPE_CHECKING, Dict
+from collections import OrderedDict
+from math import ceil, floor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 
 import pygameextra as pe
 from rm_api import DocumentCollection, Document
@@ -8,6 +9,7 @@ from rm_api import DocumentCollection, Document
 from gui.defaults import Defaults
 from gui.helpers import dynamic_text
 from gui.literals import MAIN_MENU_MODES
+from gui.preview_handler import PreviewHandler
 from gui.rendering import render_document, render_collection
 from gui.screens.scrollable_view import ScrollableView
 
@@ -16,46 +18,110 @@ if TYPE_CHECKING:
 
 
 class DocumentTreeViewer(ScrollableView, ABC):
+    TITLE_TEXTS_LIMIT = 1024
+
     def __init__(self, gui: 'GUI', area):
         self.AREA = area
         self.texts: Dict[str, pe.Text] = {}
+        # (uuid, name, width, scale, font size) : (text, inverted text, full text), the least recently used are dropped
+        self.title_texts: OrderedDict[tuple, Tuple[pe.Text, pe.Text, pe.Text]] = OrderedDict()
+        self.title_text_keys: Dict[str, tuple] = {}  # The title texts in use by every item
         self.selected_documents = set()
         self.selected_document_collections = set()
         self.x_padding_collections = 0
         self.x_padding_documents = 0
         self.last_width = None
+        # The sorted items are kept until the items, their metadata or the sorting changes
+        self._sorted_items: Optional[Tuple[List[DocumentCollection], List[Document]]] = None
+        self._sorted_generation = None
         self._scale = self.gui.config.doc_view_scale
+        self.preview_metrics_display = pe.Text(
+            'DEBUG', Defaults.DEBUG_FONT, self.gui.ratios.debug_text_size,
+            colors=(pe.colors.white, pe.colors.darkorange)
+        ) if self.gui.config.debug else None
         super().__init__(gui)
 
-    def handle_texts(self):
-        document_collections: Dict[str, DocumentCollection] = dict(self.document_collections)
-        documents: Dict[str, Document] = dict(self.documents)
+    def invalidate_sorting(self):
+        self._sorted_items = None
+
+    @property
+    def sorted_items(self) -> Tuple[List[DocumentCollection], List[Document]]:
+        main_menu = self.gui.main_menu
+        if self._sorted_items is None or self._sorted_generation != main_menu.sorting_generation:
+            self._sorted_items = (
+                list(main_menu.get_sorted_document_collections(self.document_collections.values())),
+                list(main_menu.get_sorted_documents(self.documents.values()))
+            )
+            self._sorted_generation = main_menu.sorting_generation
+        return self._sorted_items
+
+    def columns_from(self, x: float) -> int:
+        # How many items fit on a row starting at x, matching how the rows wrap when rendering
+        columns = 1
+        x += self.document_width + self.gui.ratios.main_menu_document_padding
+        while x + self.document_width <= self.width:
+            columns += 1
+            x += self.document_width + self.gui.ratios.main_menu_document_padding
+        return columns
+
+    def handle_title_texts(self, item: Union[DocumentCollection, Document]):
+        """Prepare the title texts of an item about to be rendered"""
+        name = item.metadata.visible_name
+        if isinstance(item, DocumentCollection):
+            font_details = (Defaults.FOLDER_TITLE_FONT, self.gui.ratios.document_tree_view_folder_title_size)
+            width = (self.document_width if self.mode == 'grid' else self.width) - \
+                self.gui.ratios.main_menu_document_padding
+            if item.metadata.pinned:
+                width -= self.gui.icons['star'].width + self.gui.ratios.main_menu_folder_padding
+            if item.tags and self.mode == 'grid':
+                width -= self.gui.icons['tag'].width + self.gui.ratios.main_menu_folder_padding
+            colors = (Defaults.TEXT_COLOR, Defaults.TEXT_COLOR_H)
+        else:
+            font_details = (Defaults.DOCUMENT_SUBTITLE_FONT, self.gui.ratios.document_tree_view_document_title_size)
+            width = self.document_width if self.mode == 'grid' else self.width
+            colors = (Defaults.DOCUMENT_TITLE_COLOR, Defaults.DOCUMENT_TITLE_COLOR_INVERTED)
 
-        # Preparing the document collection texts
-        font_details = (Defaults.FOLDER_TITLE_FONT, self.gui.ratios.document_tree_view_folder_title_size)
+        key = (item.uuid, name, width, self.scale, font_details[1])
+        if self.title_text_keys.get(item.uuid) == key:
+            self.title_texts.move_to_end(key)
+            return
+        if (texts := self.title_texts.get(key)) is None:
+            shortened_text = dynamic_text(name, *font_details, width)
+            texts = self.title_texts[key] = (
+                pe.Text(shortened_text, *font_details, (0, 0), colors[0]),
+                pe.Text(shortened_text, *font_details, (0, 0), colors[1]),
+                pe.Text(name, *font_details, (0, 0), colors[0]),
+            )
+            while len(self.title_texts) > self.TITLE_TEXTS_LIMIT:
+                self.discard_title_texts(*self.title_texts.popitem(last=False))
+        else:
+            self.title_texts.move_to_end(key)
+        self.texts[item.uuid], self.texts[item.uuid + '_inverted'], self.texts[item.uuid + '_full'] = texts
+        self.title_text_keys[item.uuid] = key
+
+    def discard_title_texts(self, key, _texts):
+        uuid = key[0]
+        if self.title_text_keys.get(uuid) != key:
+            return  # The item is using newer texts
+        del self.title_text_keys[uuid]
+        for text_key in (uuid, uuid + '_inverted', uuid + '_full'):
+            self.texts.pop(text_key, None)
+
+    def handle_texts(self, document_collections: Optional[Dict[str, DocumentCollection]] = None,
+                     documents: Optional[Dict[str, Document]] = None):
+        """Make the small texts of these items, or of all the items"""
+        self.invalidate_sorting()
+        if document_collections is None and documents is None:
+            document_collections = dict(self.document_collections)
+            documents = dict(self.documents)
+        document_collections = document_collections or {}
+        documents = documents or {}
+
+        # The title texts are created once the items become visible
         item_counts = set()
-        for uuid, document_collection in document_collections.items():
-            item_counts.add(document_collection.get_item_count(self.gui.api))
-            if self.texts.get(uuid) is None or self.texts[
-                uuid + '_full'
-            ].text != document_collection.metadata.visible_name:
-                width_reduction = self.gui.ratios.main_menu_document_padding
-                if document_collection.metadata.pinned:
-                    width_reduction += self.gui.icons['star'].width + self.gui.ratios.main_menu_folder_padding
-                if document_collection.tags and self.mode == 'grid':
-                    width_reduction += self.gui.icons['tag'].width + self.gui.ratios.main_menu_folder_padding
-                shortened_text = dynamic_text(document_collection.metadata.visible_name, *font_details,
-                                              (self.document_width if self.mode == 'grid' else self.width)
-                                              - width_reduction
-                                              )
-                self.texts[uuid] = pe.Text(shortened_text, *font_details, (0, 0), Defaults.TEXT_COLOR)
-                self.texts[uuid + '_inverted'] = pe.Text(shortened_text, *font_details, (0, 0),
-                                                         Defaults.TEXT_COLOR_H)
-                self.texts[uuid + '_full'] = pe.Text(document_collection.metadata.visible_name,
-                                                     *font_details, (0, 0), Defaults.TEXT_COLOR)
-
-        # Preparing the document texts
-        font_details = (Defaults.DOCUMENT_SUBTITLE_FONT, self.gui.ratios.document_tree_view_document_title_size)
+        for uuid in document_collections:
+            item_counts.add(self.gui.main_menu.library.item_count(uuid))
+
         page_counts = set()
         page_of_counts = set()
         pages_read = set()
@@ -66,38 +132,36 @@ class DocumentTreeViewer(ScrollableView, ABC):
                 page_of_counts.add((document.metadata.last_opened_page + 1, document.get_page_count()))
             elif document.content.file_type == 'epub':
                 pages_read.add(document.get_read())
-            if self.texts.get(uuid) is None or self.texts[uuid + '_full'].text != document.metadata.visible_name:
-                shortened_text = dynamic_text(document.metadata.visible_name, *font_details,
-                                              self.document_width if self.mode == 'grid' else self.width)
-                self.texts[uuid] = pe.Text(shortened_text, *font_details, (0, 0),
-                                           Defaults.DOCUMENT_TITLE_COLOR)
-                self.texts[uuid + '_inverted'] = pe.Text(shortened_text, *font_details
-                                                         , (0, 0),
-                                                         Defaults.DOCUMENT_TITLE_COLOR_INVERTED)
-                self.texts[uuid + '_full'] = pe.Text(document.metadata.visible_name, *font_details, (0, 0),
-                                                     Defaults.DOCUMENT_TITLE_COLOR)
 
         # Handle small texts
         font_details = (Defaults.DOCUMENT_SUBTITLE_FONT, self.gui.ratios.document_tree_view_small_info_size)
         for item_count in item_counts:
+            if f'item_count_{item_count}' in self.texts:
+                continue
             self.texts[f'item_count_{item_count}'] = pe.Text(f'{item_count} items', *font_details,
                                                              (0, 0), Defaults.TEXT_COLOR)
             self.texts[f'item_count_{item_count}_inverted'] = pe.Text(f'{item_count} items', *font_details,
                                                                       (0, 0), Defaults.TEXT_COLOR_H)
 
         for page_count in page_counts:
+            if f'page_count_{page_count}' in self.texts:
+                continue
             self.texts[f'page_count_{page_count}'] = pe.Text(f'{page_count} pages', *font_details,
                                                              (0, 0), Defaults.TEXT_COLOR)
             self.texts[f'page_count_{page_count}_inverted'] = pe.Text(f'{page_count} pages', *font_details,
                                                                       (0, 0), Defaults.TEXT_COLOR_H)
 
         for page_of, pages in page_of_counts:
+            if f'page_of_{page_of}_{pages}' in self.texts:
+                continue
             self.texts[f'page_of_{page_of}_{pages}'] = pe.Text(f'Page {page_of} of {pages}', *font_details,
                                                                (0, 0), Defaults.TEXT_COLOR)
             self.texts[f'page_of_{page_of}_{pages}_inverted'] = pe.Text(f'Page {page_of} of {pages}', *font_details,
                                                                         (0, 0), Defaults.TEXT_COLOR_H)
 
         for page_read in pages_read:
+            if f'page_read_{page_read}' in self.texts:
+                continue
             self.texts[f'page_read_{page_read}'] = pe.Text(f'{page_read}% read', *font_details,
                                                            (0, 0), Defaults.TEXT_COLOR)
             self.texts[f'page_read_{page_read}_inverted'] = pe.Text(f'{page_read}% read', *font_details,
@@ -175,16 +239,24 @@ class DocumentTreeViewer(ScrollableView, ABC):
         else:
             collections_x = self.gui.ratios.main_menu_x_padding
 
-        x = collections_x
+        sorted_document_collections, sorted_documents = self.sorted_items
 
-        y = self.gui.ratios.main_menu_top_padding / 2
-        y += top
+        y_start = self.gui.ratios.main_menu_top_padding / 2
+        y_start += top
 
-        # Rendering the folders
+        # Rendering the folders, starting from the first row that is visible
+        folder_distance = self.gui.ratios.main_menu_folder_height_distance
+        columns = self.columns_from(collections_x) if self.mode == 'grid' else 1
+        first_row = max(0, floor(-y_start / folder_distance) - 1)
+        x = collections_x
+        y = y_start + first_row * folder_distance
         document_collection_width = \
             self.document_width if self.mode == 'grid' else self.width - self.gui.ratios.main_menu_x_padding * 2
-        for i, document_collection in enumerate(
-                self.gui.main_menu.get_sorted_document_collections(self.document_collections.values())):
+        for i in range(first_row * columns, len(sorted_document_collections)):
+            if y > self.height:
+                break
+            document_collection = sorted_document_collections[i]
+            self.handle_title_texts(document_collection)
             render_collection(self.gui, document_collection, self.texts,
                               self.gui.main_menu.set_parent, x, y, document_collection_width,
                               self.select_document_collection,
@@ -192,30 +264,47 @@ class DocumentTreeViewer(ScrollableView, ABC):
 
             if self.mode == 'grid':
                 x += self.document_width + self.gui.ratios.main_menu_document_padding
-                if x + self.document_width > self.width and i + 1 < len(self.document_collections):
+                if x + self.document_width > self.width and i + 1 < len(sorted_document_collections):
                     x = collections_x
-                    y += self.gui.ratios.main_menu_folder_height_distance
+                    y += folder_distance
             else:
-                y += self.gui.ratios.main_menu_folder_height_distance
-                if (self.mode == 'list' and len(self.documents) > 0) or i < len(self.document_collections) - 1:
+                y += folder_distance
+                if (self.mode == 'list' and len(sorted_documents) > 0) or i < len(sorted_document_collections) - 1:
                     line_y = y - self.gui.ratios.main_menu_folder_margin_y / 2
                     pe.draw.line(Defaults.LINE_GRAY,
                                  (collections_x, line_y), (self.width - collections_x, line_y),
                                  self.gui.ratios.line)
 
-        # Resetting the x and y for the documents
-        if len(self.document_collections) > 0:
+        # Resetting the x and y for the documents, the folders below the view were skipped
+        if len(sorted_document_collections) > 0:
+            if self.mode == 'grid':
+                y = y_start + (ceil(len(sorted_document_collections) / columns) - 1) * folder_distance
+            else:
+                y = y_start + len(sorted_document_collections) * folder_distance
             y += self.gui.ratios.main_menu_folder_height_last_distance
         else:
             y = top
 
         x = self.x_padding_documents
 
-        # Rendering the documents
+        # Rendering the documents, starting from the first row within the prefetch margin
         full_document_height = self.document_height + self.gui.ratios.main_menu_document_height_distance
-        for i, document in enumerate(self.gui.main_menu.get_sorted_documents(self.documents.values())):
-            if y + full_document_height > 0:
+        # Previews are queued up to a screen away from the view, ordered by their distance from it
+        prefetch_margin = self.height
+        can_load_previews = self.gui.loader.files_to_load is None
+        columns = self.columns_from(x)
+        first_row = max(0, floor((-y - prefetch_margin) / full_document_height) - 1)
+        y += first_row * full_document_height
+        PreviewHandler.SCHEDULER.new_frame()
+        for i in range(first_row * columns, len(sorted_documents)):
+            document = sorted_documents[i]
+            distance = max(0, -(y + full_document_height), y - self.height)
+            if distance > 0:
+                if distance < prefetch_margin and can_load_previews:
+                    PreviewHandler.prefetch(document, distance)
+            else:
                 # Render the document
+                self.handle_title_texts(document)
                 rect = pe.Rect(
                     x, y,
                     self.document_width,
@@ -234,11 +323,28 @@ class DocumentTreeViewer(ScrollableView, ABC):
                                 self.scale, self.select_document, document.uuid in self.selected_documents)
 
             x += self.document_width + self.gui.ratios.main_menu_document_padding
-            if x + self.document_width > self.width and i + 1 < len(self.documents):
+            if x + self.document_width > self.width and i + 1 < len(sorted_documents):
                 x = self.x_padding_documents
                 y += full_document_height
-            if y > self.height:
+            if y > self.height + prefetch_margin:
                 break
+        # Cancel the previews of documents that are no longer close to the view
+        PreviewHandler.SCHEDULER.cancel_stale()
+
+        if self.gui.config.debug:
+            self.render_preview_metrics()
+
+    def render_preview_metrics(self):
+        cache = PreviewHandler.CACHED_PREVIEW.stats
+        self.preview_metrics_display.text = (
+            f"Previews: {cache['entries']} ({cache['used'] / 1048576:.0f}/{cache['budget'] / 1048576:.0f}MB) "
+            f"hits: {cache['hits']} misses: {cache['misses']} | "
+            f"queued: {PreviewHandler.SCHEDULER.queued} running: {PreviewHandler.SCHEDULER.running} | "
+            f"{PreviewHandler.METRICS.overlay_text}"
+        )
+        self.preview_metrics_display.init()
+        self.preview_metrics_display.rect.bottomleft = (0, self.height)
+        self.preview_metrics_display.display()
 
     def select_document(self, document_uuid: str):
         if document_uuid in self.selected_documents:
@@ -271,9 +377,8 @@ class DocumentTreeViewer(ScrollableView, ABC):
                 self.scale += 0.1
             else:
                 self.scale -= 0.1
+            # The title texts are recreated for the new width when they are shown
             self.scale = max(0.5, min(2.08, self.scale))
-            self.texts.clear()
-            self.handle_texts()
 
     @property
     def scale(self):
@@ -281,6 +386,8 @@ class DocumentTreeViewer(ScrollableView, ABC):
 
     @scale.setter
     def scale(self, value):
+        # Keep the scale on its steps, so the scaled previews and icons can be reused
+        value = round(value, 2)
         self._scale = value
         self.gui.config.doc_view_scale = value
         self.gui.dirty_config = True
@@ -112,6 +112,7 @@ class ImportScreen(pe.ChildContext, ButtonReadyMixin, TitledMixin):
         if len(self.dummy_documents) > 0:  # Delete the predefined dummy document
             DocumentViewer.PROBLEMATIC_DOCUMENTS.remove(self.dummy_documents[0].uuid)
             del self.dummy_documents[0]
+            self.doc_view.invalidate_sorting()
 
     def predefine_item(self, items: int = 1):
         self.expected_documents += items
@@ -121,6 +122,7 @@ class ImportScreen(pe.ChildContext, ButtonReadyMixin, TitledMixin):
             self.dummy_documents[-1].provision = True
             self.dummy_documents[-1].metadata.last_modified += timedelta(weeks=10).total_seconds()
             DocumentViewer.PROBLEMATIC_DOCUMENTS.add(self.dummy_documents[-1].uuid)
+        self.doc_view.invalidate_sorting()
 
     def loop(self):
         self.title.display()
@@ -191,7 +193,7 @@ class ImportScreen(pe.ChildContext, ButtonReadyMixin, TitledMixin):
             preview = PreviewHandler.get_preview(document, Defaults.PREVIEW_SIZE)
             if document.content.file_type == "pdf":
                 light_documents.append(document.replace_pdf(surfaces_to_pdf([
-                    preview.get_finished_surface()
+                    preview.surface
                 ]) if preview else self.data['light_pdf']))
 
         return light_documents
@@ -11,6 +11,7 @@ from rm_api.notifications.models import SyncCompleted, NewDocuments
 from gui import APP_NAME
 from gui.defaults import Defaults
 from gui.helpers import invert_icon
+from gui.preview_handler import PreviewHandler
 from gui.screens.main_menu import MainMenu
 from gui.screens.mixins import LogoMixin
 
@@ -244,6 +245,9 @@ class Loader(pe.ChildContext, LogoMixin):
 
         self.loading_complete_marker = time.time()
 
+        # Remove the thumbnails of deleted or changed documents
+        PreviewHandler.collect_garbage(self.api.documents)
+
         if self.config.download_everything:
             for document in self.api.documents.values():
                 if not document.available and not document.downloading:
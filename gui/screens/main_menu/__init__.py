@@ -1,21 +1,26 @@
 import time
 from queue import Queue
 from threading import Lock
-from typing import TYPE_CHECKING, Dict, List, Union
+from typing import TYPE_CHECKING, Dict, List, Union, Tuple, Any, Optional
 
 import pygameextra as pe
+from rm_api.helpers import threaded
 from rm_api.models import Document
 from rm_api.notifications.models import SyncRefresh, FileSyncProgress, NewDocuments, DocumentSyncProgress
 from rm_api.sync_stages import DOWNLOAD_CONTENT
 
 from gui.defaults import Defaults
-from gui.events import ResizeEvent
-from gui.helpers import shorten_path
+from gui.events import ResizeEvent, UserFavoritesConfirmed, RenameNotebookConfirmed, RenameCollectionConfirmed, \
+    MoveConfirmed
+from gui.helpers import shorten_path, natural_sort_key
 from gui.i10n import t
+from gui.library_index import LibraryIndex
 from gui.rendering import draw_bottom_loading_bar, get_bottom_bar_rect, render_header
 from gui.screens.main_menu.context_bars import TopBar, TopBarSelectOne, TopBarSelectMulti, TopBarSelectMove, TopBarTrash
 from gui.screens.main_menu.context_menus import SideBar
 from gui.screens.main_menu.main_doc_view import MainMenuDocView
+from gui.screens.name_field_screen import CustomInputBox
+from gui.search_index import SearchIndex
 from gui.sync_stages import SYNC_STAGE_TEXTS
 
 if TYPE_CHECKING:
@@ -35,17 +40,24 @@ class MainMenu(pe.ChildContext):
     ratios: 'Ratios'
 
     SORTING_FUNCTIONS = {
+        'name': lambda item: natural_sort_key(item.metadata.visible_name),
+        'created': lambda item: item.metadata.created_time,
         'last_modified': lambda item: item.metadata.last_modified,
+        'last_opened': lambda item: item.metadata.last_opened,
+        'page_count': lambda item: item.get_page_count(),
+        'size': lambda item: sum(file.size for file in item.files),
     }
+    # Collections are only sorted by their name
+    COLLECTION_SORTING_FUNCTIONS = ('name',)
 
     HEADER_TEXTS = {
         'my_files': "menu.common.my_files",
         'trash': "menu.common.trash",
-        'favorites': "Favorites",
-        'tags': "Tags",
-        'notebooks': "Notebooks",
-        'pdfs': "PDFs",
-        'ebooks': "Ebooks",
+        'favorites': "sidebar.favorites",
+        'tags': "menu.common.tags",
+        'notebooks': "sidebar.views.notebooks",
+        'pdfs': "sidebar.views.pdfs",
+        'ebooks': "sidebar.views.ebooks",
     }
 
     SMALL_HEADER_TEXTS = {
@@ -56,15 +68,23 @@ class MainMenu(pe.ChildContext):
     MAINTAIN_TEXT_KEYS = (
         *HEADER_TEXTS.keys(),
         *SMALL_HEADER_TEXTS.keys(),
-        'debug'
+        'debug',
+        'search'
     )
 
+    # Locations showing items from every folder, kept up to date by the library index
+    VIEW_LOCATIONS = ('favorites', 'tags', 'notebooks', 'pdfs', 'ebooks')
+
     LOCATION_PARENT_MAPPING = {
         'my_files': None,
         'trash': 'trash',
+        **{location: None for location in VIEW_LOCATIONS}
     }
     LOCATION_PARENTS = list(LOCATION_PARENT_MAPPING.values())
 
+    # Only redraw when something changed, see GUI.invalidate
+    SKIP_IDLE_FRAMES = True
+
     file_sync_operation: Union[None, FileSyncProgress]
 
     resync_icon: pe.Image
@@ -79,16 +99,23 @@ class MainMenu(pe.ChildContext):
         self.documents: Dict[str, Document] = {}
         self.texts: Dict[str, pe.Text] = {}
         self.path_queue = Queue()
+        # (menu location, path, width) : the breadcrumb layout, see render_header
+        self.header_layout: Optional[Tuple[tuple, Any]] = None
         self.call_lock = Lock()
         self.file_sync_operation = None
         self.previous_t = 0
         self.rotate_angle = 0
-        # TODO: Maybe load from settings
-        self.current_sorting_mode = 'last_modified'
-        # reversed is equivalent to descending
-        # obviously, non-reversed is ascending
-        self.current_sorting_reverse = True
+        # Item : (item, {sorting mode : sort key}), computed once until the item changes
+        self.sort_keys: Dict[str, Tuple[tuple, Dict[str, Any]]] = {}  # Item : signature, sort keys
+        # Bumped whenever the sorted order of the items might change
+        self.sorting_generation = 0
         self.move_mode = False
+        self.library = LibraryIndex(parent.api)
+        self.library.sync()
+        self.search = SearchIndex(self.library)
+        self.search_query = ''
+        self.search_pending = False  # Waiting for the search index to sync
+        self.search_syncing = False
         super().__init__(parent)
         parent.main_menu = self  # Assign myself as the main menu
         # Update the location properly by setting it
@@ -115,6 +142,15 @@ class MainMenu(pe.ChildContext):
 
         self.context_menus = {}
 
+        self.texts['search'] = pe.Text(t("menu.common.search"), Defaults.PATH_FONT, self.ratios.main_menu_path_size,
+                                       (0, 0), Defaults.LINE_GRAY)
+        self.search_field = CustomInputBox(
+            parent, (0, 0, self.ratios.main_menu_search_width, self.ratios.main_menu_search_height),
+            Defaults.PATH_FONT, '', self.ratios.main_menu_path_size,
+            text_colors=Defaults.DOCUMENT_TITLE_COLOR,
+            selected_colors=Defaults.DOCUMENT_TITLE_COLOR_INVERTED,
+        )
+
         # Document debug button text
         self.texts['debug'] = pe.Text(
             'DEBUG',
@@ -161,6 +197,9 @@ class MainMenu(pe.ChildContext):
     @navigation_parent.setter
     def navigation_parent(self, uuid):
         self._navigation_parent = uuid
+        if self.search_query:
+            # Opening a folder from the search results
+            self.clear_search()
         if all((
                 self.menu_location == 'my_files',
                 self.config.save_last_opened_folder,
@@ -193,65 +232,127 @@ class MainMenu(pe.ChildContext):
             self.navigation_parent = 'trash'
         elif value == 'my_files':
             self.navigation_parent = self.config.last_opened_folder
+        elif value in self.VIEW_LOCATIONS:
+            self.navigation_parent = None
 
     def __call__(self, *args, **kwargs):
         super().__call__(*args, **kwargs)
         self.bar()
 
-    def item_filter(self, item, document_collections):
-        return (
-                item.parent == self.navigation_parent or
-                not self.navigation_parent
-                and item.parent
-                and self.config.show_orphans
-                and item.parent not in self.LOCATION_PARENTS
-                and item.parent not in document_collections
-        )
-
     def get_items(self):
-        # Copy the document collections and documents incase they change
-        document_collections = dict(self.api.document_collections)
-        documents = dict(self.api.documents)
+        if self.search_query:
+            self.get_search_results()
+        elif self.menu_location in self.VIEW_LOCATIONS:
+            self.document_collections, self.documents = self.library.get_view(self.menu_location)
+        else:
+            self.document_collections, self.documents = self.library.get_children(
+                self.navigation_parent, self.config.show_orphans
+            )
 
-        # Filtering the document collections and documents with the current parent
+        # Preparing the path queue and the path texts
+        self.path_queue.queue.clear()
+        self.header_layout = None
+        parent = self.navigation_parent
+        while (collection := self.api.document_collections.get(parent)) is not None:
+            self.path_queue.put(parent)
+            text_key = f'path_{parent}'
+
+            # Render the path text
+            if self.texts.get(text_key) is None:
+                self.texts[text_key] = pe.Text(
+                    shorten_path(collection.metadata.visible_name),
+                    Defaults.PATH_FONT,
+                    self.ratios.main_menu_path_size,
+                    (0, 0), Defaults.TEXT_COLOR
+                )
+            parent = collection.parent
+        self.doc_view.handle_texts()
+
+    def add_items(self, uuids: List[str]):
+        """Show the new items that belong in the current location, only making the texts for them"""
+        self.request_search_sync()
+        if any(uuid not in self.library.parents for uuid in uuids):
+            # Items were removed
+            self.get_items()
+            return
+        if self.search_query:
+            # The results update once the search index synced
+            self.search_pending = True
+            return
+        if self.menu_location in self.VIEW_LOCATIONS:
+            view = self.library.views[self.menu_location]
+            belongs = lambda uuid: uuid in view and not self.library.is_trashed(uuid)
+        elif not self.navigation_parent and self.config.show_orphans:
+            # Like get_children, the root also shows the items whose parent collection is missing
+            belongs = lambda uuid: \
+                self.library.parents.get(uuid) == self.navigation_parent or self.library.is_orphan(uuid)
+        else:
+            belongs = lambda uuid: self.library.parents.get(uuid) == self.navigation_parent
+        document_collections = {}
+        documents = {}
+        for uuid in uuids:
+            # The item counts of the shown collections change as items are added to them
+            if (parent := self.library.parents.get(uuid)) in self.document_collections:
+                document_collections[parent] = self.document_collections[parent]
+            if not belongs(uuid):
+                continue
+            if (collection := self.api.document_collections.get(uuid)) is not None:
+                self.document_collections[uuid] = document_collections[uuid] = collection
+            elif (document := self.api.documents.get(uuid)) is not None:
+                self.documents[uuid] = documents[uuid] = document
+        if document_collections or documents:
+            self.doc_view.handle_texts(document_collections, documents)
+
+    def get_search_results(self):
+        results = self.search.search(self.search_query, self.menu_location == 'trash')
+        if results is None:
+            # Keep showing the previous results until the index is synced
+            self.search_pending = True
+            self.request_search_sync()
+            return
+        self.search_pending = False
         self.document_collections = {
-            key: item for key, item in
-            document_collections.items()
-            if self.item_filter(item, document_collections)
+            uuid: collection for uuid in results
+            if (collection := self.api.document_collections.get(uuid)) is not None
         }
         self.documents = {
-            key: item for key, item in
-            documents.items()
-            if self.item_filter(item, document_collections)
+            uuid: document for uuid in results
+            if (document := self.api.documents.get(uuid)) is not None
         }
 
-        # Preparing the path queue and the path texts
-        self.path_queue.queue.clear()
-        if self.navigation_parent is not None:
-            parent = self.navigation_parent
-            while parent is not None:
-                self.path_queue.put(parent)
-                text_key = f'path_{parent}'
-
-                # Render the path text
-                if self.texts.get(text_key) is None:
-                    try:
-                        text = shorten_path(document_collections[parent].metadata.visible_name)
-                    except:
-                        del self.path_queue.queue[-1]
-                        parent = None
-                        continue
-                    self.texts[text_key] = pe.Text(
-                        text,
-                        Defaults.PATH_FONT,
-                        self.ratios.main_menu_path_size,
-                        (0, 0), Defaults.TEXT_COLOR
-                    )
-                try:
-                    parent = document_collections[parent].parent
-                except KeyError:
-                    parent = None
-        self.doc_view.handle_texts()
+    def request_search_sync(self):
+        self.search.dirty = True
+        if self.search_query and not self.search_syncing:
+            self.search_syncing = True
+            self.sync_search()
+
+    @threaded
+    def sync_search(self):
+        try:
+            while self.search.dirty:
+                self.search.sync()
+        finally:
+            self.search_syncing = False
+            self.parent_context.invalidate()
+
+    def clear_search(self):
+        self.search_field.value = ''
+        self.search_field.cursor_index = 0
+        self.search_field.refresh_text()
+        self.search_query = ''
+
+    def render_search_field(self):
+        self.search_field.display()
+        if self.search_field.focused:
+            self.parent_context.invalidate()  # Keep the cursor blinking
+        if not self.search_field.value and not self.search_field.focused:
+            self.texts['search'].display()
+        if self.search_field.value != self.search_query:
+            self.search_query = self.search_field.value
+            self.get_items()
+            self.doc_view.reset_top()
+        elif self.search_pending and not self.search.dirty:
+            self.get_items()
 
     def pre_loop(self):
         if 'screenshot' in self.icons:
@@ -260,17 +361,73 @@ class MainMenu(pe.ChildContext):
             self.side_bar()
 
     def set_parent(self, uuid=None):  # This function is from before navigation_parent was a property
+        if uuid and self.menu_location in self.VIEW_LOCATIONS:
+            # Opening a folder from a view continues in my files
+            self.config.main_menu_menu_location = 'my_files'
+            self.parent_context.dirty_config = True
         self.navigation_parent = uuid or self.LOCATION_PARENT_MAPPING[self.menu_location]
 
+    @property
+    def current_sorting_mode(self):
+        if self.config.main_menu_sorting_mode not in self.SORTING_FUNCTIONS:
+            return 'last_modified'
+        return self.config.main_menu_sorting_mode
+
+    @property
+    def current_sorting_reverse(self):
+        # reversed is equivalent to descending
+        # obviously, non-reversed is ascending
+        return self.config.main_menu_sorting_reverse
+
+    def set_sorting(self, mode: str, reverse: bool):
+        self.config.main_menu_sorting_mode = mode
+        self.config.main_menu_sorting_reverse = reverse
+        self.parent_context.dirty_config = True
+        self.invalidate_sorting()
+
+    def invalidate_sorting(self, uuids: List[str] = None):
+        if uuids is None:
+            self.sort_keys.clear()
+        else:
+            for uuid in uuids:
+                self.sort_keys.pop(uuid, None)
+        self.sorting_generation += 1
+
     @staticmethod
-    def get_sorted_document_collections(old_document_collections) -> sorted:
-        return sorted(old_document_collections, key=lambda item: item.metadata.visible_name)
+    def get_sort_signature(item: Union['Document', 'DocumentCollection']) -> tuple:
+        """What the sort keys are made from, the metadata is also changed in place"""
+        metadata = item.metadata
+        if not isinstance(item, Document):
+            return metadata.visible_name,
+        return (
+            metadata.visible_name, metadata.created_time, metadata.last_modified, metadata.last_opened,
+            item.get_page_count(), tuple(file.hash for file in item.files)
+        )
+
+    def get_sort_keys(self, item: Union['Document', 'DocumentCollection']) -> Dict[str, Any]:
+        signature = self.get_sort_signature(item)
+        cached = self.sort_keys.get(item.uuid)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if isinstance(item, Document):
+            keys = {mode: function(item) for mode, function in self.SORTING_FUNCTIONS.items()}
+        else:
+            keys = {mode: self.SORTING_FUNCTIONS[mode](item) for mode in self.COLLECTION_SORTING_FUNCTIONS}
+        self.sort_keys[item.uuid] = (signature, keys)
+        return keys
+
+    def get_sorted_document_collections(self, old_document_collections) -> List['DocumentCollection']:
+        return sorted(
+            old_document_collections, key=lambda item: self.get_sort_keys(item)['name'],
+            reverse=self.current_sorting_mode == 'name' and self.current_sorting_reverse
+        )
 
-    def get_sorted_documents(self, original_documents_list: List['Document']) -> Union[List['Document'], reversed]:
-        documents = sorted(original_documents_list, key=self.SORTING_FUNCTIONS[self.current_sorting_mode])
-        if self.current_sorting_reverse:
-            return reversed(documents)
-        return documents
+    def get_sorted_documents(self, original_documents_list: List['Document']) -> List['Document']:
+        mode = self.current_sorting_mode
+        return sorted(
+            original_documents_list, key=lambda item: self.get_sort_keys(item)[mode],
+            reverse=self.current_sorting_reverse
+        )
 
     def refresh(self):
         if self.api.sync_notifiers < 1:
@@ -284,6 +441,7 @@ class MainMenu(pe.ChildContext):
                      (self.width, self.ratios.main_menu_top_height), self.ratios.line)
 
         render_header(self.parent_context, self.texts, self.set_parent, self.path_queue)
+        self.render_search_field()
 
         self.doc_view()
 
@@ -319,12 +477,15 @@ class MainMenu(pe.ChildContext):
         if loader.files_to_load is not None:
             self.previous_t = draw_bottom_loading_bar(self.parent_context, loader.files_loaded, loader.files_to_load,
                                                       self.previous_t)
-            # Update the data if the loader has loaded more files
-            if loader.loading_feedback + 3 < loader.files_loaded:  # Update menu every 3 files
-                self.get_items()
+            # Show the items the loader added since the last frame
+            if loader.loading_feedback < loader.files_loaded:
+                self.add_items(self.library.feed())
                 loader.loading_feedback = loader.files_loaded
             self.update_sync_angle()
         elif loader.loading_feedback:
+            # The items that changed with the sync were replaced by the API, so feeding picks them up
+            self.library.feed()
+            self.request_search_sync()
             self.get_items()
             loader.loading_feedback = 0
             self.previous_t = 0
@@ -347,6 +508,12 @@ class MainMenu(pe.ChildContext):
             self.side_bar.handle_scales()
             self.doc_view.update_size()
         elif isinstance(event, NewDocuments):
+            self.invalidate_sorting(self.library.feed())
+            self.request_search_sync()
+            self.get_items()
+        elif isinstance(event, (UserFavoritesConfirmed, MoveConfirmed)):
+            self.library.update_items(event.documents + event.collections)
+            self.request_search_sync()
             self.get_items()
 
     def _non_critical_event_hook(self, event):
@@ -354,6 +521,15 @@ class MainMenu(pe.ChildContext):
             self.file_sync_operation = event
         elif isinstance(event, DocumentSyncProgress):
             self.document_sync_operations[event.document_uuid] = event
+        if isinstance(event, (RenameNotebookConfirmed, RenameCollectionConfirmed)):
+            self.invalidate_sorting([event.uuid])
+        elif isinstance(event, (UserFavoritesConfirmed, MoveConfirmed)):
+            self.invalidate_sorting(event.documents + event.collections)
+        if isinstance(event, (
+                UserFavoritesConfirmed, RenameNotebookConfirmed, RenameCollectionConfirmed, MoveConfirmed,
+                FileSyncProgress
+        )):
+            self.request_search_sync()
 
     def api_event_hook(self, event):
         self._non_critical_event_hook(event)
@@ -377,10 +553,19 @@ class MainMenu(pe.ChildContext):
         padded.topright = (self.width, 0)
         self.resync_rect.center = padded.center
 
+        # Handle the search field rect, next to the header
+        self.search_field.area.midright = (
+            self.width - self.ratios.main_menu_x_padding, self.texts['my_files'].rect.centery)
+        self.texts['search'].rect.midleft = self.search_field.area.midleft
+        self.texts['search'].rect.x += self.search_field.text.rect.left
+
     def handle_event(self, event):
+        if self.parent_context.ctrl_hold and pe.event.key_DOWN(pe.K_f):
+            self.search_field.focus()
         self.doc_view.handle_event(event)
 
     def update_sync_angle(self):
+        self.parent_context.invalidate()
         self.rotate_angle += 360 * self.delta_time
         if self.rotate_angle >= 360:
             self.rotate_angle = 0
@@ -222,9 +222,10 @@ class TopBarSelectOne(MainMenuContextBar):
     def delete(self):
         items = self.both_as_items
         sub_items = []
+        self.main_menu.library.feed()  # Index anything that was moved since
         for item in items:
             if isinstance(item, DocumentCollection):
-                sub_items.extend(item.recurse(self.api))
+                sub_items.extend(self.main_menu.library.recurse(item.uuid))
         self.deselect()
         self.api.spread_event(ev.UserDeleteConfirmed(items + sub_items))
         self.api.delete_many_documents(items + sub_items)
@@ -309,14 +310,17 @@ class TopBarSelectOne(MainMenuContextBar):
 
     @threaded
     def _rename(self, new_name: str):
+        item = self.single_item
+        old_name = item.metadata.visible_name
+        # Renamed before the event, so anything handling it sees the new name
+        item.metadata.visible_name = new_name
         self.api.spread_event(
             partial(
-                ev.RenameNotebookConfirmed if isinstance(self.single_item, Document) else ev.RenameCollectionConfirmed,
-                self.single_item.uuid, new_name, self.single_item.metadata.visible_name
+                ev.RenameNotebookConfirmed if isinstance(item, Document) else ev.RenameCollectionConfirmed,
+                item.uuid, new_name, old_name
             )
         )
-        self.single_item.metadata.visible_name = new_name
-        self.api.upload(self.single_item)
+        self.api.upload(item)
 
     @property
     def single_item(self) -> Union[Document, DocumentCollection]:
@@ -366,19 +370,13 @@ class TopBarTrash(MainMenuContextBar):
 
     @property
     def bin_items(self):
-        return [
-            item for item in self.api.documents.values() if item.parent == 'trash'
-        ]
+        return list(self.main_menu.library.get_children('trash')[1].values())
 
     @threaded
     def delete(self):
-        items = self.bin_items
-
-        for collection in self.api.document_collections.values():
-            if collection.parent != 'trash':
-                continue
-            items.extend(collection.recurse(self.api))
-            items.append(collection)
+        # Everything in the trash, including the contents of the collections
+        self.main_menu.library.feed()  # Index anything that was moved since
+        items = self.main_menu.library.recurse('trash')
 
         self.api.spread_event(ev.UserDeleteConfirmed(items))
         self.api.delete_many_documents(items)
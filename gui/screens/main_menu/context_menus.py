@@ -19,10 +19,11 @@ from gui.extensions.host_functions import ACTION_APPEND
 from gui.extensions.shared_types import rect_from_pe_rect
 from gui.file_prompts import notebook_prompt, import_debug
 from gui.helpers import new_lined_dynamic_text
+from gui.i10n import t
 from gui.pp_helpers import ContextMenu, DocumentDebugPopup
 from gui.pp_helpers.context_bar import FixedSizeContextBar
 from gui.pp_helpers.popups import ConfirmPopup
-from gui.preview_handler import PreviewHandler
+from gui.preview_handler import PreviewHandler, PreviewSources
 from gui.screens.name_field_screen import NameFieldScreen
 from gui.screens.viewer import DocumentViewer
 
@@ -73,8 +74,8 @@ class DeleteContextMenu(ContextMenu):
 
 class DebugContextMenu(ContextMenu):
     DEBUG_FOLDER = 'debug'
-    DEBUG_PREVIEW = 'debug_preview'
     DEBUG_PREVIEW_PAGE_INDEX = 'debug'
+    debug_preview: Optional[pe.Image] = None  # Kept out of the preview cache, so it is never evicted
     CLOSE_AFTER_ACTION = True
     PREVIEW_COLORS = (
         (255, 255, 255),
@@ -164,12 +165,12 @@ class DebugContextMenu(ContextMenu):
         self.reload()
 
     def test_doc_view(self):
-        if not PreviewHandler.CACHED_PREVIEW.get(self.DEBUG_PREVIEW):
+        if not DebugContextMenu.debug_preview:
             surface = pe.Surface((len(self.PREVIEW_COLORS) * 10, 100))
             with surface:
                 for i, color in enumerate(self.PREVIEW_COLORS):
                     pe.draw.rect(color, (i * 10, 0, 10, surface.height))
-            PreviewHandler.CACHED_PREVIEW[self.DEBUG_PREVIEW] = (self.DEBUG_PREVIEW_PAGE_INDEX, pe.Image(surface))
+            DebugContextMenu.debug_preview = pe.Image(surface)
 
         for document in list(self.api.documents.values()):
             if document.parent == self.DEBUG_FOLDER:
@@ -203,6 +204,9 @@ class DebugContextMenu(ContextMenu):
         progress.done = 1
         self.api.spread_event(progress)
 
+        # The items were put into the API directly
+        self.main_menu.library.feed()
+
         # Set the navigation parent
         self.main_menu.navigation_parent = self.DEBUG_FOLDER
 
@@ -216,7 +220,7 @@ class DebugContextMenu(ContextMenu):
             self.api.documents[item.uuid] = item
             item.provision = True
             item.content.c_pages.pages[0].id = self.DEBUG_PREVIEW_PAGE_INDEX
-            PreviewHandler.CACHED_PREVIEW[item.uuid] = PreviewHandler.CACHED_PREVIEW[self.DEBUG_PREVIEW]
+            PreviewHandler.CACHED_PREVIEW[item.uuid] = (PreviewSources(item).key, self.debug_preview)
 
     def import_from_directory(self):
         import_debug(self._import_from_directory)
@@ -303,6 +307,8 @@ class DebugContextMenu(ContextMenu):
             )
 
     def export_statistics(self):
+        PreviewHandler.dump_metrics(metrics_path := os.path.join(Defaults.TEMP_DIR, 'preview_metrics.json'))
+        self.api.log(f"Exported preview metrics to {metrics_path}", enable_print=False)
         self.parent_context.extension_manager.export_statistical_data()
 
 
@@ -394,24 +400,23 @@ class SideBar(FixedSizeContextBar, ContextMenu):
         {
             "text": "sidebar.filter",
             "icon": "filter",
-            "action": None,
+            "action": "filter_menu",
             "inverted_id": "filter",
-            "disabled": True,
             "context_icon": "chevron_right",
         },
         {
             "text": "sidebar.favorites",
             "icon": "star",
-            "action": None,
-            "inverted_id": "favorites",
-            "disabled": True
+            "action": "set_location",
+            "data": "favorites",
+            "inverted_id": "favorites"
         },
         {
             "text": "menu.common.tags",
             "icon": "tag",
-            "action": None,
-            "inverted_id": "tags",
-            "disabled": True
+            "action": "set_location",
+            "data": "tags",
+            "inverted_id": "tags"
         },
         {
             "text": "sidebar.extensions",
@@ -521,6 +526,17 @@ class SideBar(FixedSizeContextBar, ContextMenu):
     def currently_inverted(self):
         return self.main_menu.menu_location
 
+    def is_inverted(self, inverted_id) -> bool:
+        if inverted_id == 'filter':
+            return self.main_menu.menu_location in FilterMenu.VIEWS
+        return super().is_inverted(inverted_id)
+
+    def filter_menu(self):
+        self.handle_new_context_menu(self._filter_menu, 1)
+
+    def _filter_menu(self, ideal_position):
+        return FilterMenu(self.main_menu, ideal_position)
+
     def language_menu(self):
         self.handle_new_context_menu(self._language_menu, 6)  # 6 是语言按钮的索引
 
@@ -528,6 +544,57 @@ class SideBar(FixedSizeContextBar, ContextMenu):
         return LanguageMenu(self.main_menu, ideal_position)
 
 
+class FilterMenu(ContextMenu):
+    VIEWS = {
+        'notebooks': 'notebook',
+        'pdfs': 'text_edit',
+        'ebooks': 'glasses',
+    }  # View : icon
+
+    def __init__(self, parent: 'MainMenu', ideal_position: Tuple[int, int]):
+        self.BUTTONS = [
+            {
+                "text": f"sidebar.views.{view}",
+                "action": "set_location",
+                "icon": icon,
+                "data": view,
+                "inverted_id": view
+            }
+            for view, icon in self.VIEWS.items()
+        ]
+        self.BUTTONS += [
+            {
+                "text": f"sidebar.sorting.{mode}",
+                "action": "set_sorting",
+                "icon": "filter",
+                "data": mode,
+                "inverted_id": mode
+            }
+            for mode in parent.SORTING_FUNCTIONS
+        ]
+        # Show which way the current mode sorts, choosing it again flips it
+        direction = t("sidebar.sorting.descending" if parent.current_sorting_reverse else "sidebar.sorting.ascending")
+        for button in self.BUTTONS:
+            if button['data'] == parent.current_sorting_mode:
+                button['text'] = f"{t(button['text'])} ({direction})"
+        super().__init__(parent, ideal_position)
+
+    def is_inverted(self, inverted_id) -> bool:
+        return inverted_id in (self.main_menu.menu_location, self.main_menu.current_sorting_mode)
+
+    def set_location(self, menu_location: str):
+        self.main_menu.menu_location = menu_location
+        self.close()
+
+    def set_sorting(self, mode):
+        if mode == self.main_menu.current_sorting_mode:
+            self.main_menu.set_sorting(mode, not self.main_menu.current_sorting_reverse)
+        else:
+            # Names read best from A to Z, everything else from the newest or largest
+            self.main_menu.set_sorting(mode, mode != 'name')
+        self.close()
+
+
 class LanguageMenu(ContextMenu):
 
     def __init__(self, parent: 'MainMenu', ideal_position: Tuple[int, int]):
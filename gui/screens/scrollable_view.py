@@ -35,7 +35,10 @@ class ScrollableView(pe.Context, ABC):
         self.active_top = int(
             (1 - self.T * self.gui.delta_time) * self.active_top + self.T * self.gui.delta_time * correct_top)
         if self.active_top - 5 < self._top < self.active_top + 5:
+            if self.active_top != correct_top:
+                self.gui.invalidate()
             return self._top
+        self.gui.invalidate()  # Still easing towards the scroll position
         self._top = int((1 - self.T * self.gui.delta_time) * self._top + self.T * self.gui.delta_time * self.active_top)
 
         return self._top
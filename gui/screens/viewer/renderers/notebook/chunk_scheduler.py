@@ -0,0 +1,142 @@
+import threading
+import time
+from heapq import heappush, heappop
+from itertools import count
+from traceback import print_exc
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+
+import pygameextra as pe
+
+from gui.preview_metrics import StageTimings
+
+if TYPE_CHECKING:
+    from gui.screens.viewer.renderers.notebook.lib_rm_lines_renderer import LIB_rM_Lines_ChunkTask
+
+
+class ChunkScheduler:
+    """
+    A fixed size pool of worker threads which render the chunks of notebook pages.
+    The chunks closest to the center of the viewport are rendered first.
+    Queued chunks are dropped once their scale or page changed, or when they were not requested for a frame.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[int, 'LIB_rM_Lines_ChunkTask'] = {}  # Both queued and running chunks
+        self.queue: List[Tuple[float, int, int]] = []
+        self.condition = threading.Condition()
+        self.sequence = count()
+        self.generation = 0
+        self.workers: List[threading.Thread] = []
+        self.queue_wait = StageTimings()
+        self.render_time = StageTimings()
+        self.dropped = 0
+
+    @property
+    def worker_count(self) -> int:
+        return max(1, int(pe.settings.config.viewer_chunk_workers))
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for task in self.tasks.values() if not task.running)
+
+    @property
+    def running(self) -> int:
+        return sum(1 for task in self.tasks.values() if task.running)
+
+    def submit(self, task: 'LIB_rM_Lines_ChunkTask', priority: float = 0):
+        with self.condition:
+            if self.tasks.get(id(task)) is task:
+                task.generation = self.generation
+                if not task.running and task.priority != priority:
+                    # Requeue with the new priority, the outdated queue entry gets skipped
+                    task.priority = priority
+                    task.sequence = next(self.sequence)
+                    heappush(self.queue, (priority, task.sequence, id(task)))
+                return
+            if task.loaded or task.skipped:
+                return
+            task.priority = priority
+            task.generation = self.generation
+            task.sequence = next(self.sequence)
+            task.queued_at = time.perf_counter()
+            self.tasks[id(task)] = task
+            heappush(self.queue, (priority, task.sequence, id(task)))
+            self.ensure_workers()
+            self.condition.notify()
+
+    def _drop(self, task: 'LIB_rM_Lines_ChunkTask'):
+        del self.tasks[id(task)]
+        task.drop()
+        self.dropped += 1
+
+    def cancel(self, task: 'LIB_rM_Lines_ChunkTask'):
+        """Drop the chunk if it is still queued, a running chunk can not be stopped"""
+        with self.condition:
+            if self.tasks.get(id(task)) is task and not task.running:
+                self._drop(task)
+
+    def new_frame(self):
+        with self.condition:
+            self.generation += 1
+
+    def cancel_stale(self):
+        """Drop every queued chunk that is outdated or was not requested since the last new frame"""
+        with self.condition:
+            for task in list(self.tasks.values()):
+                if not task.running and (task.generation < self.generation or task.stale):
+                    self._drop(task)
+
+    def cancel_outdated(self):
+        """Drop every queued chunk whose scale or page changed"""
+        with self.condition:
+            for task in list(self.tasks.values()):
+                if not task.running and task.stale:
+                    self._drop(task)
+
+    def ensure_workers(self):
+        self.workers = [worker for worker in self.workers if worker.is_alive()]
+        for _ in range(self.worker_count - len(self.workers)):
+            worker = threading.Thread(target=self.work, daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def next_task(self) -> Optional['LIB_rM_Lines_ChunkTask']:
+        while self.queue:
+            priority, sequence, key = heappop(self.queue)
+            task = self.tasks.get(key)
+            if task is None or task.running or task.sequence != sequence:
+                continue  # Dropped or requeued with a different priority
+            if task.stale:
+                self._drop(task)
+                continue
+            return task
+        return None
+
+    def work(self):
+        while True:
+            with self.condition:
+                while (task := self.next_task()) is None:
+                    self.condition.wait()
+                task.running = True
+                started = time.perf_counter()
+                self.queue_wait.add(started - task.queued_at)
+            try:
+                task.load()
+            except:
+                print_exc()
+                task.drop()
+            finally:
+                with self.condition:
+                    self.render_time.add(time.perf_counter() - started)
+                    self.tasks.pop(id(task), None)
+
+    @property
+    def overlay_text(self) -> str:
+        with self.condition:
+            return (
+                f"Chunks queued: {self.queued}, running: {self.running}, dropped: {self.dropped} | "
+                f"wait p50/p95 {self.queue_wait.percentile(.5) * 1000:.1f}/"
+                f"{self.queue_wait.percentile(.95) * 1000:.1f}ms | "
+                f"render p50/p95 {self.render_time.percentile(.5) * 1000:.1f}/"
+                f"{self.render_time.percentile(.95) * 1000:.1f}ms"
+            )
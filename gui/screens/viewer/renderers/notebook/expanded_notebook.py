@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from functools import lru_cache
+from typing import Dict, Tuple
 
 import pygameextra as pe
 from pygameextra import settings
@@ -14,6 +14,8 @@ class ExpandedNotebook(ABC):
         self.frame_height = track_xy.frame_height
         self.frame_size = (self.frame_width, self.frame_height)
         self.track_xy = track_xy
+        # Kept per notebook, so the tasks go with it once the notebook is let go of
+        self.frame_tasks: Dict[Tuple[int, int, int, int], LoadTask] = {}
         if settings.config.debug:
             print(f'Expanded notebook debug, frame size: {track_xy.frame_width}, {track_xy.frame_height} {track_xy}')
 
@@ -66,7 +68,11 @@ class ExpandedNotebook(ABC):
     def get_frame_from_initial(self, frame_x, frame_y, final_width: int = None, final_height: int = None) -> pe.Sprite:
         ...
 
-    @lru_cache()
     def task_frame_from_initial(self, frame_x, frame_y, final_width: int = None,
                                 final_height: int = None) -> LoadTask:
-        return LoadTask(self.get_frame_from_initial, frame_x, frame_y, final_width, final_height)
\ No newline at end of file
+        key = (frame_x, frame_y, final_width, final_height)
+        if (task := self.frame_tasks.get(key)) is None:
+            task = self.frame_tasks[key] = LoadTask(
+                self.get_frame_from_initial, frame_x, frame_y, final_width, final_height
+            )
+        return task
\ No newline at end of file
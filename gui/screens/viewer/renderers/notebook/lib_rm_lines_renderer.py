@@ -1,6 +1,8 @@
 import threading
 import math
-from random import shuffle
+from collections import OrderedDict
+from contextlib import contextmanager
+from traceback import print_exc
 
 from pylibrm_lines import SceneTree, FailedToBuildTree
 from pylibrm_lines.renderer import Renderer
@@ -8,9 +10,10 @@ import pygameextra as pe
 from rm_lines import DocumentSizeTracker
 
 from gui.defaults import Defaults
+from gui.screens.viewer.renderers.notebook.chunk_scheduler import ChunkScheduler
 from gui.screens.viewer.renderers.notebook.expanded_notebook import ExpandedNotebook
 from gui.screens.viewer.renderers.shared_model import AbstractRenderer
-from typing import TYPE_CHECKING, Optional, List, Tuple, Dict
+from typing import TYPE_CHECKING, Optional, List, Tuple, Dict, Iterator
 
 if TYPE_CHECKING:
     from gui import GUI
@@ -60,26 +63,49 @@ class LIB_rM_Lines_ChunkTask:
             chunk_rect.height / agent.scale
         )
         self.loaded = False
+        self.skipped = False  # Dropped before rendering, it will never load
+        self.finished = False
         self.scale = agent.scale
         self.image: pe.Image = None
-        agent.total_tasks += 1
-        threading.Thread(target=self._load, daemon=True).start()
 
-    def _load(self):
+        # Used by the chunk scheduler
+        self.running = False
+        self.priority = 0
+        self.generation = 0
+        self.sequence = 0
+        self.queued_at = 0
+
+        agent.expanded_notebook.add_tasks(1)
+
+    @property
+    def stale(self) -> bool:
+        return self.scale != self.agent.scale or self.agent.expanded_notebook.discarded
+
+    def finish(self):
+        if not self.finished:
+            self.finished = True
+            self.agent.expanded_notebook.add_tasks(-1)
+
+    def drop(self):
+        self.skipped = True
+        self.finish()
+
+    def load(self):
         try:
-            self.load()
+            self._load()
         finally:
-            self.agent.total_tasks -= 1
+            self.finish()
 
-    def load(self):
+    def _load(self):
         # We need to load the data now from the renderer
         scaled_area = self.rm_area.copy()
 
-        with self.agent.lock:
-            if self.scale != self.agent.scale:
-                # Since the scale already changed, we must skip this chunk render task to free the lock for other tasks
+        with self.agent.expanded_notebook.renderers.acquire() as renderer:
+            if self.stale:
+                # Since the scale already changed, we must skip this chunk render task to free the renderer
+                self.skipped = True
                 return
-            raw = self.renderer.get_frame_raw(
+            raw = renderer.get_frame_raw(
                 *scaled_area.topleft,
                 *scaled_area.size,
                 *self.chunk_rect.size
@@ -88,6 +114,25 @@ class LIB_rM_Lines_ChunkTask:
         self.image = pe.Image(pe.pygame.image.frombytes(raw, self.chunk_rect.size, 'RGBA'))
         self.loaded = True
 
+    def get_display_rect(self, ratio: float = 1) -> pe.Rect:
+        """The chunk rect within the frame when the frame is shown at ratio times the scale it rendered at"""
+        if ratio == 1:
+            return self.chunk_rect.copy()
+        left = round(self.chunk_rect.left * ratio)
+        top = round(self.chunk_rect.top * ratio)
+        # Round the edges rather than the size, so neighbouring chunks never leave a gap
+        return pe.Rect(
+            left, top,
+            round(self.chunk_rect.right * ratio) - left,
+            round(self.chunk_rect.bottom * ratio) - top
+        )
+
+    def display(self, rect: pe.Rect):
+        if rect.size == self.chunk_rect.size:
+            self.image.display(rect.topleft)
+        else:
+            pe.display.blit(pe.pygame.transform.scale(self.image.surface.surface, rect.size), rect.topleft)
+
     @staticmethod
     def generate_hash(agent: 'LIB_rM_Lines_ChunkingAgent', chunk_rect: pe.Rect) -> int:
         return hash(
@@ -96,6 +141,101 @@ class LIB_rM_Lines_ChunkTask:
         )
 
 
+# noinspection PyPep8Naming
+class LIB_rM_Lines_TileCache:
+    """
+    The chunks of every frame of an expanded notebook, limited by the memory size of their images.
+    Once over the budget, the chunks of the scale furthest from the current zoom are evicted first,
+    the least recently used of them first.
+    """
+    BYTES_PER_PIXEL = 4  # Chunks are rendered as RGBA
+
+    def __init__(self):
+        self.scales: Dict[float, OrderedDict[int, LIB_rM_Lines_ChunkTask]] = {}  # Scale : chunks
+        self.used = 0
+        self.scale = 1  # The scale chunks are currently rendered at, set by the expanded notebook
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def budget(self) -> int:
+        return int(pe.settings.config.viewer_tile_cache_mb * 1024 * 1024)
+
+    @classmethod
+    def calculate_size(cls, chunk: LIB_rM_Lines_ChunkTask) -> int:
+        return chunk.chunk_rect.width * chunk.chunk_rect.height * cls.BYTES_PER_PIXEL
+
+    def get(self, key: int, scale: float) -> Optional[LIB_rM_Lines_ChunkTask]:
+        chunks = self.scales.get(scale)
+        if chunks is None or (chunk := chunks.get(key)) is None:
+            self.misses += 1
+            return None
+        if chunk.skipped:
+            # The scale changed before it rendered, it has to be rendered again
+            self.pop(key, scale)
+            self.misses += 1
+            return None
+        chunks.move_to_end(key)
+        self.hits += 1
+        return chunk
+
+    def put(self, key: int, chunk: LIB_rM_Lines_ChunkTask):
+        self.pop(key, chunk.scale)
+        self.scales.setdefault(chunk.scale, OrderedDict())[key] = chunk
+        self.used += self.calculate_size(chunk)
+        self.evict()
+
+    def pop(self, key: int, scale: float) -> Optional[LIB_rM_Lines_ChunkTask]:
+        if (chunks := self.scales.get(scale)) is None or (chunk := chunks.pop(key, None)) is None:
+            return None
+        self.used -= self.calculate_size(chunk)
+        if not chunks:
+            del self.scales[scale]
+        return chunk
+
+    def evict(self):
+        budget = self.budget
+        while self.used > budget:
+            # Compare the scales by their ratio, zooming is multiplicative
+            scale = max(self.scales, key=lambda other: abs(math.log(other / self.scale)))
+            chunks = self.scales[scale]
+            if scale == self.scale and len(chunks) <= 1:
+                # Never evict the chunk that is being added
+                break
+            chunk = self.pop(next(iter(chunks)), scale)
+            # Nobody would see the chunk once it renders
+            LIB_rM_Lines_ExpandedNotebook.SCHEDULER.cancel(chunk)
+            self.evictions += 1
+
+    def nearest_loaded(self, agent: 'LIB_rM_Lines_ChunkingAgent', scale: float, exclude: float) \
+            -> Optional[Tuple[float, List[LIB_rM_Lines_ChunkTask]]]:
+        """The loaded chunks of the frame at the cached scale nearest to this scale"""
+        for other in sorted(self.scales, key=lambda other: abs(math.log(other / scale))):
+            if other == exclude:
+                continue
+            chunks = [chunk for chunk in self.scales[other].values() if chunk.agent is agent and chunk.loaded]
+            if chunks:
+                return other, chunks
+        return None
+
+    def clear(self):
+        self.scales.clear()
+        self.used = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'chunks': sum(len(chunks) for chunks in self.scales.values()),
+            'scales': len(self.scales),
+            'used': self.used,
+            'budget': self.budget,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
 # noinspection PyPep8Naming
 class LIB_rM_Lines_ChunkingAgent:
     CHUNK_SIZE = 100
@@ -105,26 +245,25 @@ class LIB_rM_Lines_ChunkingAgent:
         self.base_rect = base_rect  # As scaled to the document as base size
         self.scale = 1  # Assuming no scale yet
         self.expanded_notebook = expanded_notebook
-        self.cache = {}  # A hashmap to cache chunks
 
     @property
-    def lock(self):
-        return self.expanded_notebook.lock
+    def cache(self) -> LIB_rM_Lines_TileCache:
+        return self.expanded_notebook.tile_cache
 
     @property
     def total_tasks(self):
         return self.expanded_notebook.tasks
 
-    @total_tasks.setter
-    def total_tasks(self, value: int):
-        self.expanded_notebook.tasks = value
-
-    def get_chunks(self, rect: pe.Rect, size_multiplier: float = 1):
+    def get_chunks(self, rect: pe.Rect, size_multiplier: float = 1, display_ratio: float = 1):
+        """
+        The chunks of the frame, rect is the frame at the scale of the agent, placed where it is displayed.
+        The display ratio is how much bigger the frame is displayed than the scale of the agent.
+        """
         chunk_size = int(self.CHUNK_SIZE * size_multiplier)
         chunk_count = math.ceil(rect.width / chunk_size) * math.ceil(rect.height / chunk_size)
         if chunk_count > 20:
             # If we have too many chunks, we can maybe adjust the size a little
-            return self.get_chunks(rect, size_multiplier * 1.1)
+            return self.get_chunks(rect, size_multiplier * 1.1, display_ratio)
 
         chunk_rects: List[pe.Rect] = []
         x_offset = 0
@@ -146,28 +285,102 @@ class LIB_rM_Lines_ChunkingAgent:
         screen_rect = pe.Rect(0, 0, *pe.display.get_size())
 
         chunks: List[LIB_rM_Lines_ChunkTask] = []
-        shuffle(chunk_rects)  # Randomize the order for more even rendering
         for chunk_rect in chunk_rects:
-            aligned_chunk_rect = chunk_rect.move(rect.topleft)
+            aligned_chunk_rect = pe.Rect(
+                chunk_rect.x * display_ratio, chunk_rect.y * display_ratio,
+                chunk_rect.width * display_ratio, chunk_rect.height * display_ratio
+            ).move(rect.topleft)
             if not aligned_chunk_rect.colliderect(screen_rect):
                 continue
             hash_of_chunk = LIB_rM_Lines_ChunkTask.generate_hash(self, chunk_rect)
-            if hash_of_chunk in self.cache:
-                chunks.append(self.cache[hash_of_chunk])
-                continue
-            chunk = LIB_rM_Lines_ChunkTask(
-                self.renderer,
-                self, chunk_rect
-            )
-            self.cache[hash_of_chunk] = chunk
+            if (chunk := self.cache.get(hash_of_chunk, self.scale)) is None:
+                chunk = LIB_rM_Lines_ChunkTask(
+                    self.renderer,
+                    self, chunk_rect
+                )
+                self.cache.put(hash_of_chunk, chunk)
+            if not chunk.loaded:
+                # Render the chunks closest to the center of the screen first
+                distance = math.hypot(
+                    aligned_chunk_rect.centerx - screen_rect.centerx,
+                    aligned_chunk_rect.centery - screen_rect.centery
+                )
+                self.expanded_notebook.SCHEDULER.submit(chunk, distance)
             chunks.append(chunk)
         return chunks
 
 
+# noinspection PyPep8Naming
+class LIB_rM_Lines_RendererPool:
+    """
+    Renderers for one page, each with its own scene tree built from the same .rm file.
+    A renderer is only used by one thread at a time, so the chunks of a page render on multiple cores.
+    The extra renderers are built once all the others are busy, up to viewer_renderer_pool of them.
+    """
+
+    def __init__(self, renderer: 'Renderer'):
+        self.document = renderer.scene_tree.document
+        self.page_uuid = renderer.scene_tree.page_uuid
+        self.renderers: List['Renderer'] = [renderer]
+        self.free: List['Renderer'] = [renderer]
+        self.building = 0
+        self.failed = False  # Stop building more renderers if one of them could not be built
+        self.closed = False
+        self.condition = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return max(1, int(pe.settings.config.viewer_renderer_pool))
+
+    def _take(self) -> 'Renderer':
+        with self.condition:
+            while True:
+                if self.free:
+                    return self.free.pop()
+                if not (self.failed or self.closed) and len(self.renderers) + self.building < self.size:
+                    # Build another renderer outside of the lock
+                    self.building += 1
+                    break
+                self.condition.wait()
+        try:
+            renderer = Renderer(SceneTree.from_document(self.document, self.page_uuid))
+        except Exception:
+            with self.condition:
+                self.building -= 1
+                self.failed = True
+            return self._take()
+        with self.condition:
+            self.building -= 1
+            self.renderers.append(renderer)
+        return renderer
+
+    @contextmanager
+    def acquire(self) -> Iterator['Renderer']:
+        renderer = self._take()
+        try:
+            yield renderer
+        finally:
+            with self.condition:
+                if renderer in self.renderers:
+                    self.free.append(renderer)
+                    self.condition.notify()
+
+    def trim(self):
+        """Let go of the extra renderers, the first one belongs to the page"""
+        with self.condition:
+            self.renderers = self.renderers[:1]
+            self.free = [renderer for renderer in self.free if renderer in self.renderers]
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+        self.trim()
+
+
 class LIB_rM_Lines_Preview:
-    def __init__(self, renderer: 'Renderer', frame_x: int, frame_y: int, lock: threading.Lock):
+    def __init__(self, renderers: LIB_rM_Lines_RendererPool, frame_x: int, frame_y: int):
         self._sprite: pe.Sprite = None
-        threading.Thread(target=self.load, args=(renderer, frame_x, frame_y, lock), daemon=True).start()
+        threading.Thread(target=self.load, args=(renderers, frame_x, frame_y), daemon=True).start()
 
     def get_preview(self, size) -> Optional[pe.Sprite]:
         if not self._sprite:
@@ -175,8 +388,8 @@ class LIB_rM_Lines_Preview:
         self._sprite.resize = size
         return self._sprite
 
-    def load(self, renderer: 'Renderer', frame_x: int, frame_y: int, lock: threading.Lock):
-        with lock:
+    def load(self, renderers: LIB_rM_Lines_RendererPool, frame_x: int, frame_y: int):
+        with renderers.acquire() as renderer:
             raw_frame = renderer.get_frame_raw(
                 frame_x * renderer.paper_size[0],
                 frame_y * renderer.paper_size[1],
@@ -189,22 +402,61 @@ class LIB_rM_Lines_Preview:
 
 # noinspection PyPep8Naming
 class LIB_rM_Lines_ExpandedNotebook(ExpandedNotebook):
+    """
+    Chunks are rendered at power of two scales while zooming, so they are reused by the next zooms.
+    Once the zoom settles they are refined at the exact scale, unless it is close enough to a power of two.
+    """
+    SCHEDULER = ChunkScheduler()  # Shared by all notebooks, only the open page requests chunks
+    LEVEL_SNAP = .05  # How close in powers of two the scale has to be to use the level instead
+
     def __init__(self, renderer: 'Renderer'):
         super().__init__(LIB_rM_Lines_SizeTracker(renderer))
         self.renderer = renderer
         self.previews: Dict[Tuple[int, int], LIB_rM_Lines_Preview] = {}
-        self.lock = threading.Lock()
+        self.tile_cache = LIB_rM_Lines_TileCache()  # Shared by the chunking agents of every frame
+        self.renderers = LIB_rM_Lines_RendererPool(renderer)
         self.tasks = 0
+        self.tasks_lock = threading.Lock()
+        self.discarded = False
+        self.exact = True  # Whether to refine the chunks to the exact scale
+        self.display_scale = 1
+
+    def add_tasks(self, amount: int):
+        with self.tasks_lock:
+            self.tasks += amount
+
+    def park(self):
+        """Drop the queued chunks of this notebook, it is kept with its tiles in case the page is shown again"""
+        self.discarded = True
+        self.SCHEDULER.cancel_outdated()
+        self.renderers.trim()
+
+    def resume(self):
+        self.discarded = False
+
+    def discard(self):
+        """Drop the queued chunks of this notebook, it is no longer shown"""
+        self.discarded = True
+        self.SCHEDULER.cancel_outdated()
+        self.renderers.close()
+        self.frame_tasks.clear()
+        self.previews.clear()
+        self.tile_cache.clear()
 
     def get_preview(self, frame_x: int, frame_y: int):
         return self.previews.get((frame_x, frame_y))
 
+    def prefetch_preview(self):
+        """Start rendering the preview of the page before it is shown"""
+        if not self.previews.get((0, 0)):
+            self.previews[(0, 0)] = LIB_rM_Lines_Preview(self.renderers, 0, 0)
+
     def get_frame_from_initial(self, frame_x, frame_y, final_width: int = None,
                                final_height: int = None) -> LIB_rM_Lines_ChunkingAgent:
         final_width = final_width or self.frame_width
         final_height = final_height or self.frame_height
         if not self.previews.get(frame_hash := (frame_x, frame_y)):
-            self.previews[frame_hash] = LIB_rM_Lines_Preview(self.renderer, frame_x, frame_y, self.lock)
+            self.previews[frame_hash] = LIB_rM_Lines_Preview(self.renderers, frame_x, frame_y)
         return LIB_rM_Lines_ChunkingAgent(
             self.renderer,
             pe.Rect(
@@ -215,11 +467,133 @@ class LIB_rM_Lines_ExpandedNotebook(ExpandedNotebook):
             ), self
         )
 
+    def get_render_scale(self, scale: float) -> float:
+        level = 2 ** round(math.log2(scale))
+        if not self.exact or abs(math.log2(scale / level)) < self.LEVEL_SNAP:
+            return level
+        return scale
+
     def update_scales(self, frames, scale: float):
+        self.display_scale = scale
+        scale = self.get_render_scale(scale)
+        self.tile_cache.scale = scale  # The chunks are cached by the scale they render at
+        scale_changed = False
         for frame in frames.values():
             if not frame.loaded:
                 continue
+            scale_changed = scale_changed or frame.sprite.scale != scale
             frame.sprite.scale = scale
+        if scale_changed:
+            self.SCHEDULER.cancel_outdated()
+
+
+# noinspection PyPep8Naming
+class LIB_rM_Lines_PageCache:
+    """
+    The built pages of a notebook, least recently shown first.
+    The neighbours of the open page are built ahead on a background thread, so flipping to them is instant.
+    Keeps the open page and viewer_page_prefetch pages on either side of it.
+    """
+
+    def __init__(self, document: 'Document'):
+        self.document = document
+        self.pages: OrderedDict[str, LIB_rM_Lines_ExpandedNotebook] = OrderedDict()
+        self.unloadable = set()  # Pages that the background thread could not build
+        self.wanted: List[str] = []  # The open page and then its neighbours, closest first
+        self.shown: Optional[str] = None  # Never evicted, the neighbours might not be updated for it yet
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+    @property
+    def neighbours(self) -> int:
+        return max(0, int(pe.settings.config.viewer_page_prefetch))
+
+    @staticmethod
+    def build(document: 'Document', page_uuid: str) -> LIB_rM_Lines_ExpandedNotebook:
+        return LIB_rM_Lines_ExpandedNotebook(Renderer(SceneTree.from_document(document, page_uuid)))
+
+    def get(self, page_uuid: str) -> Optional[LIB_rM_Lines_ExpandedNotebook]:
+        with self.lock:
+            if (expanded_notebook := self.pages.get(page_uuid)) is not None:
+                self.pages.move_to_end(page_uuid)
+            return expanded_notebook
+
+    def put(self, page_uuid: str, expanded_notebook: LIB_rM_Lines_ExpandedNotebook) \
+            -> LIB_rM_Lines_ExpandedNotebook:
+        """Keep the page, unless it was built in the meantime, returns the one that is kept"""
+        with self.lock:
+            if self.closed:
+                expanded_notebook.discard()
+                return expanded_notebook
+            if (existing := self.pages.get(page_uuid)) is not None:
+                expanded_notebook.discard()
+                self.pages.move_to_end(page_uuid)
+                return existing
+            self.pages[page_uuid] = expanded_notebook
+            self._evict(page_uuid)
+            return expanded_notebook
+
+    def _evict(self, keep: Optional[str] = None):
+        # The least recently shown pages outside of the neighbours go first, then the furthest neighbours
+        size = 1 + self.neighbours * 2
+        for page_uuid in [page_uuid for page_uuid in self.pages if page_uuid not in self.wanted] + self.wanted[::-1]:
+            if len(self.pages) <= size:
+                break
+            if page_uuid == keep or page_uuid == self.shown:
+                continue
+            if (expanded_notebook := self.pages.pop(page_uuid, None)) is not None:
+                expanded_notebook.discard()
+
+    def prefetch(self, page_index: int):
+        """Build the neighbours of the open page in the background"""
+        pages = self.document.content.c_pages.pages
+        wanted = [pages[page_index].id]
+        for distance in range(1, self.neighbours + 1):
+            # The next pages first, those are flipped to the most
+            wanted.extend(pages[index].id for index in (page_index + distance, page_index - distance)
+                          if 0 <= index < len(pages))
+        with self.lock:
+            self.wanted = wanted
+            self._evict()
+        if not self.thread:
+            self.thread = threading.Thread(target=self.work, daemon=True)
+            self.thread.start()
+        self.event.set()
+
+    def next_page(self) -> Optional[str]:
+        with self.lock:
+            for page_uuid in self.wanted:
+                if page_uuid not in self.pages and page_uuid not in self.unloadable:
+                    return page_uuid
+        return None
+
+    def work(self):
+        while not self.closed:
+            self.event.wait()
+            self.event.clear()
+            while not self.closed and (page_uuid := self.next_page()):
+                try:
+                    expanded_notebook = self.build(self.document, page_uuid)
+                except (FileNotFoundError, FailedToBuildTree):
+                    self.unloadable.add(page_uuid)
+                    continue
+                except Exception:
+                    print_exc()
+                    self.unloadable.add(page_uuid)
+                    continue
+                expanded_notebook.park()
+                expanded_notebook.prefetch_preview()
+                self.put(page_uuid, expanded_notebook)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            for expanded_notebook in self.pages.values():
+                expanded_notebook.discard()
+            self.pages.clear()
+        self.event.set()
 
 
 # noinspection PyPep8Naming
@@ -236,6 +610,9 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
         self.rm_render_rect = None
         self.error = None
         self.current_page_uuid = None
+        self.expanded_notebook: Optional[LIB_rM_Lines_ExpandedNotebook] = None
+        self.pages = LIB_rM_Lines_PageCache(self.document)
+        self.prefetched_page_uuid = None
         self.rotate_icon = self.gui.icons['rotate']
         self.icon_rect = pe.Rect(0, 0, *self.rotate_icon.size)
         self.unloadable_pages = set()
@@ -243,8 +620,7 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
     def _load(self, page_uuid: str):
         # if self.document.content_data.get(file_uuid := f'{self.document.uuid}/{page_uuid}.rm'):
         try:
-            self.tree = SceneTree.from_document(self.document, page_uuid)
-            self.error = None
+            expanded_notebook = self.pages.put(page_uuid, self.pages.build(self.document, page_uuid))
         except FileNotFoundError:
             self.tree = None
             self.error = None
@@ -253,17 +629,35 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
             self.unloadable_pages.add(page_uuid)
             self.error = self.FAILED_TO_BUILD_TREE_ERROR
             return
-        if self.tree:
-            self.renderer = Renderer(self.tree)
-            self.expanded_notebook = LIB_rM_Lines_ExpandedNotebook(self.renderer)
+        else:
+            if self.current_page_uuid == page_uuid:
+                self.error = None
+                self.show(expanded_notebook)
+            elif expanded_notebook is not self.expanded_notebook:
+                # Another page was opened while this one was building, keep it for later
+                expanded_notebook.park()
         self.document_renderer.loading -= 1
 
+    def show(self, expanded_notebook: LIB_rM_Lines_ExpandedNotebook):
+        if self.expanded_notebook and self.expanded_notebook is not expanded_notebook:
+            # Keep the page around for flipping back to it
+            self.expanded_notebook.park()
+        expanded_notebook.resume()
+        self.renderer = expanded_notebook.renderer
+        self.tree = self.renderer.scene_tree
+        self.pages.shown = self.tree.page_uuid
+        self.expanded_notebook = expanded_notebook
+
     def load(self):
         self.check_and_load_page(self.document.content.c_pages.last_opened.value)
         self.document_renderer.loading -= 1  # check_and_load_page adds an extra loading
 
     def check_and_load_page(self, page_uuid: str):
         self.current_page_uuid = page_uuid
+        if expanded_notebook := self.pages.get(page_uuid):
+            self.error = None
+            self.show(expanded_notebook)
+            return
         self.document_renderer.loading += 1
         threading.Thread(target=self._load, args=(page_uuid,), daemon=True).start()
 
@@ -281,6 +675,13 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
         if self.error:
             return
 
+        if self.prefetched_page_uuid != page_uuid:
+            # The page is built, start building its neighbours
+            self.prefetched_page_uuid = page_uuid
+            self.pages.prefetch(self.document_renderer.current_page_index)
+
+        self.expanded_notebook.SCHEDULER.new_frame()
+        self.expanded_notebook.exact = self.document_renderer.zoom_ready
         frames = self.expanded_notebook.get_frames(
             -self.document_renderer.center_x, -self.document_renderer.center_y,
             *self.size, self.document_renderer.zoom
@@ -309,16 +710,38 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
             preview_sprite = preview.get_preview(rect.size) if preview else None
             preview_frame = preview_sprite.get_finished_surface() if preview_sprite else None
 
-            chunks = frame.get_chunks(rect)
+            # The chunks may be rendered at a power of two scale while zooming, they get stretched to the zoom
+            ratio = self.expanded_notebook.display_scale / frame.scale
+            render_rect = pe.Rect(*rect.topleft, math.ceil(rect.width / ratio), math.ceil(rect.height / ratio))
+            chunks = frame.get_chunks(render_rect, display_ratio=ratio)
+            loading_chunks = [chunk for chunk in chunks if not chunk.loaded]
+
+            if preview_frame:
+                for chunk in loading_chunks:
+                    display_rect = chunk.get_display_rect(ratio)
+                    pe.display.blit(preview_frame, display_rect.move(rect.topleft).topleft, display_rect)
+
+            # Until the chunks render, show the chunks of the nearest scale that has any
+            if loading_chunks and (nearest := self.expanded_notebook.tile_cache.nearest_loaded(
+                    frame, self.expanded_notebook.display_scale, frame.scale)):
+                nearest_scale, nearest_chunks = nearest
+                nearest_ratio = self.expanded_notebook.display_scale / nearest_scale
+                screen_rect = pe.Rect(0, 0, *self.gui.size)
+                for chunk in nearest_chunks:
+                    aligned_chunk_rect = chunk.get_display_rect(nearest_ratio).move(rect.topleft)
+                    if aligned_chunk_rect.colliderect(screen_rect):
+                        chunk.display(aligned_chunk_rect)
+
             for chunk in chunks:
-                aligned_chunk_rect = chunk.chunk_rect.move(rect.topleft)
+                aligned_chunk_rect = chunk.get_display_rect(ratio).move(rect.topleft)
                 if chunk.loaded:
-                    chunk.image.display(aligned_chunk_rect.topleft)
-                elif preview_frame:
-                    pe.display.blit(preview_frame, aligned_chunk_rect.topleft, chunk.chunk_rect)
+                    chunk.display(aligned_chunk_rect)
                 if self.gui.config.debug_viewer:
                     pe.draw.rect(pe.colors.red, aligned_chunk_rect, self.gui.ratios.line)
 
+        # Drop the chunks which went off screen before they rendered
+        self.expanded_notebook.SCHEDULER.cancel_stale()
+
         if self.expanded_notebook.tasks > 0:
             # Chunk rendering is happening, display a loading icon.
 
@@ -330,6 +753,9 @@ class Notebook_LIB_rM_Lines_Renderer(AbstractRenderer):
             self.rotate_icon.display(self.icon_rect.topleft)
 
     def close(self):
+        self.pages.close()
+        if self.expanded_notebook:
+            self.expanded_notebook.discard()
         if not self.tree:
             return
         try:
@@ -36,6 +36,22 @@ class rM_Lines_ExpandedNotebook(ExpandedNotebook):
     @lru_cache()
     def get_frame_from_initial(self, frame_x, frame_y, final_width: int = None, final_height: int = None,
                                scale: float = None) -> pe.Sprite:
+        final_width = final_width or self.frame_width
+        final_height = final_height or self.frame_height
+        encoded_svg_content = self.get_frame_svg(frame_x, frame_y, final_width, final_height)
+        # if self.use_lock:
+        #     with self.use_lock:
+        #         return pe.Image(BytesIO(encoded_svg_content), (final_width, final_height))
+        # else:
+        # TODO: Instead of rendering each page render the SVG once and then slice it
+        #  or use something else to render SVGs
+        if self.use_lock:
+            with self.use_lock:
+                return pe.Sprite(BytesIO(encoded_svg_content), (final_width, final_height))
+        else:
+            return pe.Sprite(BytesIO(encoded_svg_content), (final_width, final_height))
+
+    def get_frame_svg(self, frame_x, frame_y, final_width: int = None, final_height: int = None) -> bytes:
         # Replace the svg viewport with a viewport to capture the frame
 
         width = float(self.width_match.group(1))
@@ -59,18 +75,7 @@ class rM_Lines_ExpandedNotebook(ExpandedNotebook):
                              f'{self.frame_height}"',
                              svg_content)
 
-        encoded_svg_content = svg_content.encode()
-        # if self.use_lock:
-        #     with self.use_lock:
-        #         return pe.Image(BytesIO(encoded_svg_content), (final_width, final_height))
-        # else:
-        # TODO: Instead of rendering each page render the SVG once and then slice it
-        #  or use something else to render SVGs
-        if self.use_lock:
-            with self.use_lock:
-                return pe.Sprite(BytesIO(encoded_svg_content), (final_width, final_height))
-        else:
-            return pe.Sprite(BytesIO(encoded_svg_content), (final_width, final_height))
+        return svg_content.encode()
 
     def update_scales(self, frames, scale: float):
         for frame in frames.values():
@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING, Dict
 
 import pygameextra as pe
 from colorama import Fore
+from humanize import naturalsize
 
 from gui.defaults import Defaults
 from gui.pp_helpers import DraggablePuller, FullTextPopup
@@ -362,11 +363,22 @@ class DocumentRenderer(pe.ChildContext):
             )
         else:
             rm_position = (0, 0)
+        expanded_notebook = getattr(self.notebook_renderer, 'expanded_notebook', None)
+        if tile_cache := getattr(expanded_notebook, 'tile_cache', None):
+            stats = tile_cache.stats
+            tiles = (
+                f" | Tiles: {stats['chunks']} in {stats['scales']} scales, "
+                f"{naturalsize(stats['used'])} / {naturalsize(stats['budget'])}"
+                f" | {expanded_notebook.SCHEDULER.overlay_text}"
+            )
+        else:
+            tiles = ''
         return (
             f"Zoom: {self.base_zoom:.2f} * {self._zoom:.2f} | "
             f"Center: {self.center} | "
             f"Page: {self.current_page_index} | "
             f"RM Pos: {rm_position[0]:.2f}, {rm_position[1]:.2f}"
+            f"{tiles}"
         )
 
 
@@ -588,6 +600,8 @@ class DocumentViewer(pe.ChildContext):
             self.document.content.c_pages.last_opened.value = self.document_renderer.last_opened_uuid
             self.document.metadata.last_opened_page = self.document_renderer.current_page_index
             self.document.metadata.last_opened = models.now_time()
+            if main_menu := self.parent_context.main_menu:
+                main_menu.invalidate_sorting([self.document.uuid])
             threading.Thread(target=self.api.upload, args=(self.document,), kwargs={'unload': True}).start()
         else:
             self.document.unload_files()
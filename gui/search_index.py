@@ -0,0 +1,221 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict, Counter
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Set, List, Tuple, Optional, Iterable
+
+from gui.library_index import get_tags
+
+if TYPE_CHECKING:
+    from gui.library_index import LibraryIndex
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=4096)
+def tokenize(text: str) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(TOKEN_PATTERN.findall(text.lower())))
+
+
+def get_trigrams(token: str) -> Set[str]:
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def within_distance(a: str, b: str, limit: int) -> bool:
+    """Whether the edit distance between a and b is at most the limit"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    previous = list(range(len(b) + 1))
+    for i, a_character in enumerate(a, 1):
+        current = [i]
+        for j, b_character in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a_character != b_character)
+            ))
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[-1] <= limit
+
+
+class SearchIndex:
+    """
+    An inverted index of the words in the names, tags and folder paths of every item in the library.
+    Words are matched by their prefix, and with a typo or two through the trigrams of the words.
+    Syncing the index only re-indexes the items that changed since it last synced, it runs off the main thread.
+    """
+    FUZZY_MIN_LENGTH = 3  # Shorter words are only matched by their prefix
+
+    def __init__(self, library: 'LibraryIndex'):
+        self.library = library
+        self.api = library.api
+        self.postings: Dict[str, Set[str]] = defaultdict(set)  # Word : items
+        self.words: List[str] = []  # Sorted, for finding the words by their prefix
+        self.trigrams: Dict[str, Set[str]] = defaultdict(set)  # Trigram : words
+        self.item_words: Dict[str, Tuple[str, ...]] = {}
+        self.item_signatures: Dict[str, tuple] = {}
+        self.trashed: Set[str] = set()
+        self.matches: Dict[str, Set[str]] = {}  # Search term : items, until the index changes
+        self.dirty = True
+        self.lock = threading.RLock()
+
+    def get_item(self, uuid: str):
+        return self.api.document_collections.get(uuid) or self.api.documents.get(uuid)
+
+    @staticmethod
+    def get_signature(item) -> tuple:
+        return item.metadata.visible_name, item.parent, tuple(tag.name for tag in get_tags(item))
+
+    def get_path_words(self, parent: Optional[str], paths: Dict[Optional[str], Tuple[Tuple[str, ...], bool]]) \
+            -> Tuple[Tuple[str, ...], bool]:
+        """The words in the names of the parent and the folders above it, and whether it is in the trash"""
+        if (path := paths.get(parent)) is not None:
+            return path
+        if parent == 'trash':
+            return (), True
+        if parent is None or (collection := self.api.document_collections.get(parent)) is None:
+            return (), False
+        paths[parent] = ((), False)  # Stops folders which are within each other
+        words, trashed = self.get_path_words(self.library.parents.get(parent), paths)
+        paths[parent] = path = (tokenize(collection.metadata.visible_name) + words, trashed)
+        return path
+
+    def _add_word(self, word: str, uuid: str):
+        if word not in self.postings:
+            for trigram in get_trigrams(word):
+                self.trigrams[trigram].add(word)
+        self.postings[word].add(uuid)
+
+    def _remove_word(self, word: str, uuid: str):
+        postings = self.postings[word]
+        postings.discard(uuid)
+        if postings:
+            return
+        del self.postings[word]
+        for trigram in get_trigrams(word):
+            self.trigrams[trigram].discard(word)
+            if not self.trigrams[trigram]:
+                del self.trigrams[trigram]
+
+    def _remove_item(self, uuid: str):
+        for word in self.item_words.pop(uuid, ()):
+            self._remove_word(word, uuid)
+        self.item_signatures.pop(uuid, None)
+        self.trashed.discard(uuid)
+
+    def _index_item(self, uuid: str, paths: dict):
+        self._remove_item(uuid)
+        if (item := self.get_item(uuid)) is None:
+            return
+        path_words, trashed = self.get_path_words(self.library.parents.get(uuid), paths)
+        words = tuple(dict.fromkeys((
+            *tokenize(' '.join((item.metadata.visible_name, *(tag.name for tag in get_tags(item))))),
+            *path_words
+        )))
+        for word in words:
+            self._add_word(word, uuid)
+        self.item_words[uuid] = words
+        self.item_signatures[uuid] = self.get_signature(item)
+        if trashed:
+            self.trashed.add(uuid)
+
+    def update_items(self, uuids: Iterable[str]):
+        """Re-index these items, and everything within them if they are collections"""
+        with self.lock:
+            paths = {}
+            for uuid in self._with_children(uuids):
+                self._index_item(uuid, paths)
+            self._finish_update()
+
+    def _with_children(self, uuids: Iterable[str]) -> Set[str]:
+        # The path of everything within a collection changes with it
+        uuids = set(uuids)
+        for uuid in list(uuids):
+            # Anything within a collection that was not indexed yet is new and already included
+            if uuid in self.library.collections and uuid in self.item_signatures:
+                uuids.update(item.uuid for item in self.library.recurse(uuid))
+        return uuids
+
+    def _finish_update(self):
+        self.words = sorted(self.postings)
+        self.matches.clear()
+
+    def sync(self):
+        """Index the items that were added, changed or removed since the last sync"""
+        with self.lock:
+            self.dirty = False  # Changes from now on are picked up by the next sync
+            known = set(self.library.parents)
+            removed = [uuid for uuid in self.item_words if uuid not in known]
+            changed = []
+            for uuid in known:
+                if (item := self.get_item(uuid)) is None:
+                    continue
+                if self.item_signatures.get(uuid) != self.get_signature(item):
+                    changed.append(uuid)
+            for uuid in removed:
+                self._remove_item(uuid)
+            paths = {}  # The words of every folder path, shared by everything within it
+            for uuid in self._with_children(changed):
+                self._index_item(uuid, paths)
+            if removed or changed:
+                self._finish_update()
+
+    def _fuzzy_words(self, term: str) -> Iterable[str]:
+        limit = 1 if len(term) <= 5 else 2
+        trigrams = get_trigrams(term)
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self.trigrams.get(trigram, ()))
+        # Every edit changes at most three trigrams
+        required = max(1, len(trigrams) - 3 * limit - 1)
+        for word, count in shared.items():
+            if count < required:
+                continue
+            # Allow the typo to be in a word that is still being typed
+            if within_distance(term, word, limit) or within_distance(term, word[:len(term)], limit):
+                yield word
+
+    def match(self, term: str) -> Set[str]:
+        if (matches := self.matches.get(term)) is not None:
+            return matches
+        matches = set()
+        i = bisect_left(self.words, term)
+        while i < len(self.words) and self.words[i].startswith(term):
+            matches.update(self.postings[self.words[i]])
+            i += 1
+        if len(term) >= self.FUZZY_MIN_LENGTH:
+            for word in self._fuzzy_words(term):
+                matches.update(self.postings[word])
+        self.matches[term] = matches
+        return matches
+
+    def search(self, query: str, trashed: Optional[bool] = False) -> Optional[Set[str]]:
+        """
+        The items matching every word of the query, or None if the index is being updated.
+        Only the items in the trash or outside of it, unless trashed is None
+        """
+        terms = tokenize(query)
+        if not terms:
+            return set()
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if self.dirty:
+                return None
+            results = None
+            for term in terms:
+                matches = self.match(term)
+                results = set(matches) if results is None else results & matches
+                if not results:
+                    return set()
+            if trashed is None:
+                return results
+            if trashed:
+                return results & self.trashed
+            return results - self.trashed
+        finally:
+            self.lock.release()
@@ -0,0 +1,248 @@
+import mmap
+import os
+import struct
+import threading
+from traceback import print_exc
+from typing import Dict, Tuple, Optional, Iterator, Set
+
+
+class ThumbnailStore:
+    """
+    Packs every thumbnail into a single append-only data file, with a small index of where each one is.
+    The data file is memory-mapped, so loading a thumbnail never opens a file.
+
+    Every record in the data file starts with its key and length,
+    so the index can always be rebuilt from the data file if the two disagree.
+    Removed thumbnails only leave garbage behind, the data file gets compacted once there is enough of it.
+
+    Thumbnails used to be separate PNG files named after their document and page.
+    Those are moved into the data file once the document asks for them, see migrate_legacy.
+    """
+    DATA_FILE = 'thumbnails.pack'
+    INDEX_FILE = 'thumbnails.index'
+    KEY_SIZE = 64
+    HEADER = struct.Struct(f'<{KEY_SIZE}sI')  # Key, length
+    COMPACT_RATIO = .5  # Compact when at least half of the data file is garbage
+    COMPACT_MIN_SIZE = 8 * 1024 * 1024  # Don't bother compacting small data files
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.entries: Dict[str, Tuple[int, int]] = {}  # Key : (offset, length)
+        self.legacy: Set[str] = set()  # The names of the old PNG thumbnails
+        self.data_size = 0
+        self.garbage = 0
+        self._available = False
+        self.loaded = False
+        self.data = None
+        self.index = None
+        self.map: Optional[mmap.mmap] = None
+        self.lock = threading.RLock()
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory, self.DATA_FILE)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX_FILE)
+
+    def load(self):
+        with self.lock:
+            self.close()
+            self.entries = {}
+            self.data_size = 0
+            self.garbage = 0
+            self._available = os.path.isdir(self.directory)
+            self.loaded = True
+            if not self._available:
+                return
+            self.data = open(self.data_path, 'a+b')
+            self.data_size = self.data.seek(0, os.SEEK_END)
+            if not self.read_index():
+                self.rebuild_index()
+            self.index = open(self.index_path, 'a', encoding='utf-8')
+            self.find_legacy()
+            self.compact_if_fragmented()
+
+    def read_index(self) -> bool:
+        """Load the index file, returns False if it does not match the data file"""
+        if not os.path.exists(self.index_path):
+            return self.data_size == 0
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if not line.endswith('\n'):
+                    continue  # Partially written line
+                if len(parts) == 2 and parts[1] == '-':
+                    self.entries.pop(parts[0], None)
+                    continue
+                if len(parts) != 3:
+                    continue
+                key, offset, length = parts[0], int(parts[1]), int(parts[2])
+                if offset + length > self.data_size:
+                    return False
+                self.entries[key] = (offset, length)
+        self.garbage = self.data_size - sum(length + self.HEADER.size for _, length in self.entries.values())
+        return all(self.check_record(key, offset) for key, (offset, _) in self.entries.items())
+
+    def check_record(self, key: str, offset: int) -> bool:
+        self.data.seek(offset - self.HEADER.size)
+        record_key, _ = self.HEADER.unpack(self.data.read(self.HEADER.size))
+        return record_key.rstrip(b'\0').decode() == key
+
+    def rebuild_index(self):
+        self.entries = {}
+        offset = 0
+        self.data.seek(0)
+        while offset + self.HEADER.size <= self.data_size:
+            record_key, length = self.HEADER.unpack(self.data.read(self.HEADER.size))
+            if offset + self.HEADER.size + length > self.data_size:
+                break  # The last record was not fully written
+            self.entries[record_key.rstrip(b'\0').decode()] = (offset + self.HEADER.size, length)
+            self.data.seek(length, os.SEEK_CUR)
+            offset += self.HEADER.size + length
+        # Drop anything after the last complete record
+        self.data.truncate(offset)
+        self.data_size = offset
+        self.garbage = self.data_size - sum(length + self.HEADER.size for _, length in self.entries.values())
+        self.write_index_file(self.index_path)
+
+    def write_index_file(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, (offset, length) in self.entries.items():
+                f.write(f'{key} {offset} {length}\n')
+
+    def find_legacy(self):
+        with os.scandir(self.directory) as entries:
+            self.legacy = {
+                entry.name[:-len('.png')] for entry in entries if entry.is_file() and entry.name.endswith('.png')
+            }
+
+    def migrate_legacy(self, key: str, legacy_name: str) -> Optional[bytes]:
+        """
+        Move the old PNG thumbnail into the data file under the key, returns the thumbnail if there was one.
+        The old thumbnails are named {document uuid}.{page id}, which can only be turned into a key with the document.
+        """
+        with self.lock:
+            if not self.available or legacy_name not in self.legacy:
+                return None
+            path = os.path.join(self.directory, f'{legacy_name}.png')
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.write(key, data)
+                os.remove(path)
+            except OSError:
+                print_exc()
+                return None
+            finally:
+                self.legacy.discard(legacy_name)
+            return data
+
+    @property
+    def available(self) -> bool:
+        if not self.loaded:
+            self.load()
+        return self._available
+
+    def __contains__(self, key: str):
+        if not self.loaded:
+            self.load()
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self) -> Iterator[str]:
+        return iter(list(self.entries.keys()))
+
+    def read(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            if not (entry := self.entries.get(key)):
+                return None
+            offset, length = entry
+            if self.map is None or offset + length > len(self.map):
+                # The data file grew since it was mapped
+                if self.map is not None:
+                    self.map.close()
+                self.data.flush()
+                self.map = mmap.mmap(self.data.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.map[offset:offset + length]
+
+    def write(self, key: str, data: bytes):
+        with self.lock:
+            if not self.available:
+                return
+            if key in self.entries:
+                self.discard(key)
+            self.data.seek(0, os.SEEK_END)
+            self.data.write(self.HEADER.pack(key.encode(), len(data)))
+            self.data.write(data)
+            self.data.flush()
+            offset = self.data_size + self.HEADER.size
+            self.data_size = offset + len(data)
+            self.entries[key] = (offset, len(data))
+            # The index is written after the data, so it never points at missing data
+            self.index.write(f'{key} {offset} {len(data)}\n')
+            self.index.flush()
+
+    def discard(self, key: str):
+        with self.lock:
+            if not (entry := self.entries.pop(key, None)):
+                return
+            self.garbage += entry[1] + self.HEADER.size
+            self.index.write(f'{key} -\n')
+            self.index.flush()
+
+    @property
+    def fragmentation(self) -> float:
+        return self.garbage / self.data_size if self.data_size else 0
+
+    def compact_if_fragmented(self):
+        if self.data_size >= self.COMPACT_MIN_SIZE and self.fragmentation >= self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the data file with only the thumbnails that are still in use"""
+        with self.lock:
+            if not self.available:
+                return
+            temporary_data_path = f'{self.data_path}.tmp'
+            temporary_index_path = f'{self.index_path}.tmp'
+            entries = {}
+            offset = 0
+            with open(temporary_data_path, 'wb') as f:
+                for key in list(self.entries.keys()):
+                    data = self.read(key)
+                    f.write(self.HEADER.pack(key.encode(), len(data)))
+                    f.write(data)
+                    offset += self.HEADER.size
+                    entries[key] = (offset, len(data))
+                    offset += len(data)
+            self.close()
+            self.entries = entries
+            self.write_index_file(temporary_index_path)
+            # If this gets interrupted between the two, the index gets rebuilt from the data file
+            os.replace(temporary_data_path, self.data_path)
+            os.replace(temporary_index_path, self.index_path)
+            self.load()
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            if self.data is not None:
+                self.data.close()
+                self.data = None
+            if self.index is not None:
+                self.index.close()
+                self.index = None
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            'thumbnails': len(self.entries),
+            'size': self.data_size,
+            'garbage': self.garbage,
+        }
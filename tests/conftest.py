@@ -0,0 +1,63 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from rm_api import Document, DocumentCollection
+from rm_api.models import Tag
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+try:
+    import pygameextra as pe
+    from box import Box
+    from gui.gui import DEFAULT_CONFIG
+    from gui.i10n import I10nManager
+except ImportError:
+    pass  # The tests which need the GUI are skipped
+else:
+    # The GUI normally sets these up before anything else is imported
+    pe.settings.config = Box(DEFAULT_CONFIG)
+    pe.settings.config_file_path = os.path.join(tempfile.gettempdir(), 'moss-tests-config.json')
+    I10nManager(SimpleNamespace(config=pe.settings.config))
+
+
+
+class FakeAPI(SimpleNamespace):
+    """Only the items of the API, which are built without their files"""
+
+    def __init__(self):
+        super().__init__(document_collections={}, documents={})
+
+    def add_collection(self, uuid: str, name: str, parent: str = None, pinned: bool = False,
+                       tags=()) -> DocumentCollection:
+        collection = object.__new__(DocumentCollection)
+        collection.uuid = uuid
+        collection.metadata = SimpleNamespace(visible_name=name, parent=parent, pinned=pinned)
+        collection.tags = [Tag({'name': tag, 'timestamp': 0}) for tag in tags]
+        self.document_collections[uuid] = collection
+        return collection
+
+    def add_document(self, uuid: str, name: str, parent: str = None, pinned: bool = False, tags=(),
+                     file_type: str = 'notebook') -> Document:
+        document = object.__new__(Document)
+        document._uuid = uuid
+        document.metadata = SimpleNamespace(
+            visible_name=name, parent=parent, pinned=pinned, created_time='0', last_modified='0', last_opened='0'
+        )
+        document.content = SimpleNamespace(
+            tags=[Tag({'name': tag, 'timestamp': 0}) for tag in tags], file_type=file_type,
+            usable=True, c_pages=SimpleNamespace(pages=[])
+        )
+        document.files = []
+        self.documents[uuid] = document
+        return document
+
+    def remove(self, uuid: str):
+        self.document_collections.pop(uuid, None)
+        self.documents.pop(uuid, None)
+
+
+@pytest.fixture
+def api():
+    return FakeAPI()
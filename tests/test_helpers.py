@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+
+import pygameextra as pe
+
+from gui.helpers import check_width, dotted_dynamic_text, dynamic_text, get_prefix_widths, new_lined_dynamic_text
+
+TITLES = (
+    'Notes',
+    'Meeting notes from the quarterly planning session',
+    'A_very_long_file_name_without_any_spaces_at_all.pdf',
+    'Ünïcödé títlé — with symbols & numbers 12345',
+    'Word',
+)
+
+
+@pytest.fixture(scope='module')
+def font():
+    pe.pygame.font.init()
+    return pe.pygame.font.Font(None, 20)
+
+
+def measure(text: str, font) -> int:
+    return sum(metric[4] for metric in font.metrics(text))
+
+
+def reference_dotted(name: str, font, width: int) -> str:
+    # Cutting one character from each side at a time, like before the widths were cached
+    center = len(name) // 2
+    left = right = center
+    while measure(name[:left] + '...' + name[right:], font) > width:
+        if left == 0:
+            return '...'
+        left -= 1
+        right += 1
+    return name[:left] + '...' + name[right:]
+
+
+def reference_new_lined(name: str, font, width: int) -> str:
+    lines = []
+    line = []
+    for word in name.split(' '):
+        word = word.replace('\n', '').strip()
+        if not word:
+            continue
+        if measure(' '.join(line + [word]), font) > width:
+            lines.append(' '.join(line).strip())
+            line = [word]
+        else:
+            line.append(word)
+    if line:
+        lines.append(' '.join(line).strip())
+    return '\n'.join(lines)
+
+
+def test_widths(font):
+    for title in TITLES:
+        assert check_width(title, font) == measure(title, font)
+        assert get_prefix_widths(title, font) == [measure(title[:i], font) for i in range(len(title) + 1)]
+
+
+def test_dotted(font):
+    title = TITLES[1]
+    width = measure(title, font) // 2
+    dotted = dotted_dynamic_text(title, font, width)
+    start, end = dotted.split('...')
+    assert title.startswith(start) and title.endswith(end)
+    assert measure(dotted, font) <= width
+    # Only as much as needed is cut
+    assert measure(title[:len(start) + 1] + '...' + title[-len(end) - 1:], font) > width
+
+
+def test_dotted_too_narrow(font):
+    assert dotted_dynamic_text(TITLES[1], font, 1) == '...'
+
+
+def test_new_lined(font):
+    title = TITLES[1]
+    width = measure(title, font) // 3
+    lines = new_lined_dynamic_text(title, font, width).split('\n')
+    assert ' '.join(lines) == title
+    assert len(lines) > 1
+    assert all(measure(line, font) <= width for line in lines)
+
+
+def test_matches_reference(font):
+    shuffle = random.Random(0)
+    for title in TITLES:
+        for _ in range(20):
+            width = shuffle.randint(measure('...', font), measure(title, font) + 10)
+            assert dotted_dynamic_text(title, font, width) == reference_dotted(title, font, width)
+            assert new_lined_dynamic_text(title, font, width) == reference_new_lined(title, font, width)
+
+
+def test_dynamic_text():
+    title = 'Meeting   notes from the\nquarterly planning session'
+    assert dynamic_text('Notes', None, 20, 1000) == 'Notes'
+    assert dynamic_text(title, None, 20, 1000, True) == 'Meeting notes from the quarterly planning session'
+    assert '\n' not in dynamic_text(title, None, 20, 100)
+    assert '...' in dynamic_text(title, None, 20, 100)
+    assert dynamic_text(title, None, 20, 100, True).count('\n') > 1
@@ -0,0 +1,106 @@
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+
+from gui.library_index import LibraryIndex
+
+
+@pytest.fixture
+def library(api):
+    api.add_collection('work', 'Work')
+    api.add_collection('reports', 'Reports', 'work')
+    api.add_document('q1', 'Q1', 'reports', file_type='pdf')
+    api.add_document('notes', 'Notes', 'work', pinned=True)
+    api.add_document('recipes', 'Recipes', tags=('Cooking',), file_type='epub')
+    library = LibraryIndex(api)
+    library.sync()
+    return library
+
+
+def get_uuids(children):
+    document_collections, documents = children
+    return set(document_collections), set(documents)
+
+
+def test_sync(library):
+    assert get_uuids(library.get_children(None)) == ({'work'}, {'recipes'})
+    assert get_uuids(library.get_children('work')) == ({'reports'}, {'notes'})
+    assert library.item_count('work') == 2
+    assert library.recursive_count('work') == 3
+
+
+def test_views(library):
+    assert get_uuids(library.get_view('favorites')) == (set(), {'notes'})
+    assert get_uuids(library.get_view('tags')) == (set(), {'recipes'})
+    assert get_uuids(library.get_view('pdfs')) == (set(), {'q1'})
+    assert get_uuids(library.get_view('ebooks')) == (set(), {'recipes'})
+
+
+def test_feed_without_changes(library):
+    assert library.feed() == []
+
+
+def test_feed_new_item(api, library):
+    api.add_document('q2', 'Q2', 'reports')
+    assert library.feed() == ['q2']
+    assert get_uuids(library.get_children('reports')) == (set(), {'q1', 'q2'})
+    assert library.recursive_count('work') == 4
+
+
+def test_feed_replaced_item(api, library):
+    api.add_document('notes', 'Notes', None)
+    assert library.feed() == ['notes']
+    assert get_uuids(library.get_children(None)) == ({'work'}, {'recipes', 'notes'})
+    assert get_uuids(library.get_view('favorites')) == (set(), set())
+
+
+def test_feed_moved_in_place(api, library):
+    assert library.recursive_count('work') == 3
+    api.documents['q1'].metadata.parent = None
+    assert library.feed() == ['q1']
+    assert get_uuids(library.get_children(None)) == ({'work'}, {'recipes', 'q1'})
+    assert library.recursive_count('work') == 2
+
+
+def test_feed_changed_views_in_place(api, library):
+    api.documents['q1'].metadata.pinned = True
+    api.documents['recipes'].content.tags.clear()
+    assert sorted(library.feed()) == ['q1', 'recipes']
+    assert get_uuids(library.get_view('favorites')) == (set(), {'notes', 'q1'})
+    assert get_uuids(library.get_view('tags')) == (set(), set())
+
+
+def test_feed_trashed(api, library):
+    api.document_collections['work'].metadata.parent = 'trash'
+    assert library.feed() == ['work']
+    assert library.is_trashed('q1')
+    assert get_uuids(library.get_children('trash')) == ({'work'}, set())
+    assert get_uuids(library.get_view('favorites')) == (set(), set())
+
+
+def test_feed_removed(api, library):
+    api.remove('recipes')
+    assert library.feed() == ['recipes']
+    assert get_uuids(library.get_children(None)) == ({'work'}, set())
+    assert get_uuids(library.get_view('tags')) == (set(), set())
+
+
+def test_orphans(api, library):
+    api.add_document('lost', 'Lost', 'missing')
+    library.feed()
+    assert library.is_orphan('lost')
+    assert not library.is_orphan('q1')
+    assert get_uuids(library.get_children(None)) == ({'work'}, {'recipes'})
+    assert get_uuids(library.get_children(None, include_orphans=True)) == ({'work'}, {'recipes', 'lost'})
+
+
+def test_recurse(library):
+    assert [item.uuid for item in library.recurse('work')] == ['notes', 'q1', 'reports']
+
+
+def test_recurse_skips_moved_items(api, library):
+    # The API moved the items, but the index was not fed yet
+    api.documents['notes'].metadata.parent = None
+    api.document_collections['reports'].metadata.parent = None
+    assert library.recurse('work') == []
+    assert library.recursive_count('work') == 0
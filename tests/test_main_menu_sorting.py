@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+pytest.importorskip('pylibrm_lines')
+# The file dialogs raise their own exception without a desktop to show them on
+main_menu = pytest.importorskip('gui.screens.main_menu', exc_type=Exception)
+
+MainMenu = main_menu.MainMenu
+
+
+@pytest.fixture
+def menu():
+    # Skip the constructor, only the cached sort keys are tested
+    menu = object.__new__(MainMenu)
+    menu.sort_keys = {}
+    menu.sorting_generation = 0
+    return menu
+
+
+def test_collection_keys(api, menu):
+    collection = api.add_collection('work', 'Work 10')
+    keys = menu.get_sort_keys(collection)
+    assert list(keys) == ['name']
+    collection.metadata.visible_name = 'Work 2'
+    assert menu.get_sort_keys(collection)['name'] < keys['name']
+
+
+def test_keys_follow_metadata_changed_in_place(api, menu):
+    document = api.add_document('notes', 'Notes')
+    keys = menu.get_sort_keys(document)
+    assert menu.get_sort_keys(document) is keys
+    document.metadata.last_opened = '100'
+    assert menu.get_sort_keys(document)['last_opened'] == '100'
+    document.content.c_pages.pages.append(object())
+    assert menu.get_sort_keys(document)['page_count'] == 1
+    document.files.append(SimpleNamespace(hash='a', size=10))
+    assert menu.get_sort_keys(document)['size'] == 10
+    document.metadata.visible_name = 'Renamed'
+    assert menu.get_sort_keys(document)['name'] == menu.get_sort_keys(api.add_document('b', 'Renamed'))['name']
+
+
+def test_invalidate_sorting(api, menu):
+    notes = api.add_document('notes', 'Notes')
+    recipes = api.add_document('recipes', 'Recipes')
+    keys = menu.get_sort_keys(notes)
+    menu.get_sort_keys(recipes)
+    menu.invalidate_sorting(['recipes'])
+    assert menu.sorting_generation == 1
+    assert list(menu.sort_keys) == ['notes']
+    assert menu.get_sort_keys(notes) is keys
+    menu.invalidate_sorting()
+    assert menu.sort_keys == {}
+    assert menu.sorting_generation == 2
@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+pytest.importorskip('pylibrm_lines')
+# The file dialogs raise their own exception without a desktop to show them on
+preview_handler = pytest.importorskip('gui.preview_handler', exc_type=Exception)
+
+import pygameextra as pe
+
+PreviewCache = preview_handler.PreviewCache
+PREVIEW_SIZE = 100 * 100 * PreviewCache.BYTES_PER_PIXEL
+
+
+def make_preview(width: int = 100, height: int = 100) -> pe.Image:
+    return pe.Image(pe.pygame.Surface((width, height)))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # Room for two previews
+    monkeypatch.setattr(pe.settings.config, 'preview_cache_budget_mb', PREVIEW_SIZE * 2.5 / 1024 / 1024)
+    return PreviewCache()
+
+
+def test_calculate_size():
+    assert PreviewCache.calculate_size(None) == 0
+    assert PreviewCache.calculate_size(make_preview(10, 20)) == 10 * 20 * PreviewCache.BYTES_PER_PIXEL
+
+
+def test_tracks_used_memory(cache):
+    cache['a'] = ('a', make_preview())
+    cache['b'] = ('b', None)
+    assert cache.used == PREVIEW_SIZE
+    cache['a'] = ('a', make_preview(50, 100))
+    assert cache.used == PREVIEW_SIZE // 2
+    cache.pop('a')
+    assert cache.used == 0
+    assert len(cache) == 1
+
+
+def test_evicts_least_recently_used(cache):
+    cache['a'] = ('a', make_preview())
+    cache['b'] = ('b', make_preview())
+    assert cache.get('a') is not None
+    cache['c'] = ('c', make_preview())
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+    assert cache.used == PREVIEW_SIZE * 2
+    assert cache.stats['evictions'] == 1
+
+
+def test_keeps_preview_over_budget(cache):
+    cache['a'] = ('a', make_preview())
+    cache['big'] = ('big', make_preview(300, 100))
+    assert list(cache.entries) == ['big']
+    assert cache.used == PREVIEW_SIZE * 3
+
+
+def test_variants_count_towards_budget(cache):
+    cache['a'] = ('a', make_preview())
+    cache['b'] = ('b', make_preview())
+    cache.set_variant('b', (200, 50), make_preview(200, 50))
+    assert cache.get_variant('b', (200, 50)) is not None
+    assert 'a' not in cache
+    assert cache.used == PREVIEW_SIZE * 2
+    cache.pop('b')
+    assert cache.get_variant('b', (200, 50)) is None
+    assert cache.used == 0
+
+
+def test_variant_of_missing_preview_is_ignored(cache):
+    cache.set_variant('a', (50, 50), make_preview(50, 50))
+    assert cache.get_variant('a', (50, 50)) is None
+    assert cache.used == 0
+
+
+def test_missing_preview(cache):
+    with pytest.raises(KeyError):
+        _ = cache['a']
+    assert cache.get('a') is None
+    cache['a'] = ('a', None)
+    assert cache['a'] == ('a', None)
+    assert cache.stats['misses'] == 2
+    assert cache.stats['hits'] == 1
+
+
+def test_clear(cache):
+    cache['a'] = ('a', make_preview())
+    cache.set_variant('a', (50, 50), make_preview(50, 50))
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.used == 0
+    assert cache.stats['variants'] == 0
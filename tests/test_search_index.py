@@ -0,0 +1,106 @@
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+
+from gui.library_index import LibraryIndex
+from gui.search_index import SearchIndex, tokenize, within_distance
+
+
+@pytest.fixture
+def library(api):
+    api.add_collection('work', 'Work')
+    api.add_collection('reports', 'Quarterly reports', 'work')
+    api.add_document('q1', 'Report Q1', 'reports')
+    api.add_document('recipes', 'Recipes', tags=('Cooking',))
+    api.add_document('old', 'Old report', 'trash')
+    library = LibraryIndex(api)
+    library.sync()
+    return library
+
+
+@pytest.fixture
+def index(library):
+    index = SearchIndex(library)
+    index.sync()
+    return index
+
+
+def test_tokenize():
+    assert tokenize('Report, report Q1!') == ('report', 'q1')
+
+
+def test_within_distance():
+    assert within_distance('report', 'report', 0)
+    assert within_distance('reprot', 'report', 2)
+    assert not within_distance('reprot', 'report', 1)
+    assert not within_distance('a', 'abcd', 2)
+
+
+def test_not_synced(library):
+    index = SearchIndex(library)
+    assert index.search('report') is None
+    index.sync()
+    assert index.search('report') == {'q1', 'reports'}
+
+
+def test_prefix(index):
+    assert index.search('repo') == {'q1', 'reports'}
+    assert index.search('reci') == {'recipes'}
+    assert index.search('') == set()
+
+
+def test_every_word_has_to_match(index):
+    assert index.search('report q1') == {'q1'}
+    assert index.search('report recipes') == set()
+
+
+def test_typos(index):
+    assert index.search('reprot') == {'q1', 'reports'}
+    assert index.search('recipse') == {'recipes'}
+    # Short words are only matched by their prefix
+    assert index.search('qa') == set()
+
+
+def test_folder_path(index):
+    assert index.search('work') == {'work', 'reports', 'q1'}
+    assert index.search('quarterly') == {'reports', 'q1'}
+
+
+def test_tags(index):
+    assert index.search('cooking') == {'recipes'}
+
+
+def test_trash(index):
+    assert index.search('old') == set()
+    assert index.search('old', trashed=True) == {'old'}
+    assert index.search('report', trashed=None) == {'q1', 'reports', 'old'}
+
+
+def test_rename(api, library, index):
+    api.documents['q1'].metadata.visible_name = 'Summary'
+    index.sync()
+    assert index.search('summary') == {'q1'}
+    assert index.search('q1') == set()
+
+
+def test_rename_folder(api, library, index):
+    api.document_collections['work'].metadata.visible_name = 'Archive'
+    index.sync()
+    assert index.search('archive') == {'work', 'reports', 'q1'}
+    assert index.search('work') == set()
+
+
+def test_move_to_trash(api, library, index):
+    api.documents['recipes'].metadata.parent = 'trash'
+    library.feed()
+    index.sync()
+    assert index.search('recipes') == set()
+    assert index.search('recipes', trashed=True) == {'recipes'}
+
+
+def test_remove(api, library, index):
+    api.remove('recipes')
+    library.feed()
+    index.sync()
+    assert index.search('recipes', trashed=None) == set()
+    assert 'recipes' not in index.postings
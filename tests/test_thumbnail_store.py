@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+pytest.importorskip('rm_lines_sys')
+
+from gui.thumbnail_store import ThumbnailStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ThumbnailStore(str(tmp_path))
+    store.load()
+    yield store
+    store.close()
+
+
+def reload(store: ThumbnailStore) -> ThumbnailStore:
+    store.close()
+    store = ThumbnailStore(store.directory)
+    store.load()
+    return store
+
+
+def test_write_and_read(store):
+    store.write('a', b'first')
+    store.write('b', b'second')
+    assert store.read('a') == b'first'
+    assert store.read('b') == b'second'
+    assert store.read('c') is None
+    assert 'a' in store and 'c' not in store
+    assert len(store) == 2
+
+
+def test_overwrite_leaves_garbage(store):
+    store.write('a', b'first')
+    store.write('a', b'replaced')
+    assert store.read('a') == b'replaced'
+    assert store.garbage == ThumbnailStore.HEADER.size + len(b'first')
+
+
+def test_discard(store):
+    store.write('a', b'first')
+    store.discard('a')
+    store.discard('a')
+    assert store.read('a') is None
+    assert store.garbage == store.data_size
+
+
+def test_reload(store):
+    store.write('a', b'first')
+    store.write('b', b'second')
+    store.write('a', b'replaced')
+    store.discard('b')
+    store = reload(store)
+    try:
+        assert list(store.keys()) == ['a']
+        assert store.read('a') == b'replaced'
+        assert store.garbage == store.data_size - ThumbnailStore.HEADER.size - len(b'replaced')
+    finally:
+        store.close()
+
+
+def test_rebuilds_missing_index(store):
+    store.write('a', b'first')
+    store.write('b', b'second')
+    store.close()
+    os.remove(store.index_path)
+    store = reload(store)
+    try:
+        assert store.read('a') == b'first'
+        assert store.read('b') == b'second'
+        assert os.path.exists(store.index_path)
+    finally:
+        store.close()
+
+
+def test_drops_partially_written_record(store):
+    store.write('a', b'first')
+    store.close()
+    with open(store.data_path, 'ab') as f:
+        f.write(ThumbnailStore.HEADER.pack(b'b', 100))
+        f.write(b'cut short')
+    os.remove(store.index_path)
+    store = reload(store)
+    try:
+        assert list(store.keys()) == ['a']
+        assert store.data_size == os.path.getsize(store.data_path) == ThumbnailStore.HEADER.size + len(b'first')
+        store.write('b', b'second')
+        assert store.read('b') == b'second'
+    finally:
+        store.close()
+
+
+def test_compact(store):
+    store.write('a', b'first')
+    store.write('b', b'second')
+    store.write('a', b'replaced')
+    store.discard('b')
+    store.compact()
+    assert store.garbage == 0
+    assert store.read('a') == b'replaced'
+    assert os.path.getsize(store.data_path) == ThumbnailStore.HEADER.size + len(b'replaced')
+    store = reload(store)
+    try:
+        assert store.read('a') == b'replaced'
+    finally:
+        store.close()
+
+
+def test_compact_if_fragmented(store, monkeypatch):
+    monkeypatch.setattr(ThumbnailStore, 'COMPACT_MIN_SIZE', 0)
+    store.write('a', b'first')
+    store.write('b', b'second')
+    store.compact_if_fragmented()
+    assert store.data_size == os.path.getsize(store.data_path)
+    store.discard('b')
+    store.compact_if_fragmented()
+    assert store.data_size == ThumbnailStore.HEADER.size + len(b'first')
+
+
+def test_migrate_legacy(tmp_path):
+    # The old thumbnails are named after the document and page, which are longer than a key
+    legacy_name = f'{"d" * 36}.{"p" * 36}'
+    (tmp_path / f'{legacy_name}.png').write_bytes(b'old')
+    store = ThumbnailStore(str(tmp_path))
+    store.load()
+    try:
+        assert legacy_name in store.legacy
+        assert (tmp_path / f'{legacy_name}.png').exists()
+        assert store.migrate_legacy('a', legacy_name) == b'old'
+        assert store.read('a') == b'old'
+        assert not (tmp_path / f'{legacy_name}.png').exists()
+        assert store.migrate_legacy('a', legacy_name) is None
+    finally:
+        store.close()
+
+
+def test_missing_directory(tmp_path):
+    store = ThumbnailStore(str(tmp_path / 'missing'))
+    assert not store.available
+    store.write('a', b'first')
+    assert store.read('a') is None
+    assert store.migrate_legacy('a', 'legacy') is None
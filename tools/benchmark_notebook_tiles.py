@@ -0,0 +1,99 @@
+"""
+Measures how many notebook chunks per second the viewer renders with different renderer pool sizes.
+Give it any .rm file, like one from the sync cache, the page is rendered zoomed in the way the viewer chunks it.
+Each pool size renders the same chunks, the speedup should follow the number of cores.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Render without opening a window
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Run from anywhere
+
+import pygameextra as pe
+from box import Box
+from colorama import Fore
+
+from gui.gui import DEFAULT_CONFIG
+
+config = Box(DEFAULT_CONFIG)
+setattr(pe.settings, 'config', config)
+
+from pylibrm_lines import SceneTree
+from pylibrm_lines.renderer import Renderer
+from gui.screens.viewer.renderers.notebook.lib_rm_lines_renderer import LIB_rM_Lines_RendererPool
+
+PAGE_UUID = 'page'
+
+
+def make_document(rm_path: str, landscape: bool):
+    # Just enough of a document for building scene trees from the .rm file
+    return SimpleNamespace(
+        uuid='benchmark',
+        api=SimpleNamespace(sync_file_path=os.path.dirname(os.path.abspath(rm_path))),
+        files_available={f'benchmark/{PAGE_UUID}.rm': SimpleNamespace(hash=os.path.basename(rm_path))},
+        content=SimpleNamespace(is_landscape=landscape, file_type='notebook'),
+    )
+
+
+def get_chunks(paper_size, zoom: float, chunk_size: int):
+    # The page area and output size of every chunk, like LIB_rM_Lines_ChunkTask
+    width, height = (int(v * zoom) for v in paper_size)
+    return [
+        (int(x / zoom), int(y / zoom), int(chunk_size / zoom), int(chunk_size / zoom), chunk_size, chunk_size)
+        for y in range(0, height, chunk_size)
+        for x in range(0, width, chunk_size)
+    ]
+
+
+def benchmark(document, chunks, workers: int, rounds: int) -> float:
+    config.viewer_renderer_pool = workers
+    pool = LIB_rM_Lines_RendererPool(Renderer(SceneTree.from_document(document, PAGE_UUID)))
+
+    def render(chunk):
+        with pool.acquire() as renderer:
+            renderer.get_frame_raw(*chunk)
+
+    with ThreadPoolExecutor(workers) as executor:
+        # Build every renderer of the pool before timing
+        list(executor.map(render, chunks[:workers]))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            list(executor.map(render, chunks))
+        elapsed = time.perf_counter() - started
+    pool.close()
+    return len(chunks) * rounds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the notebook chunk rendering of the Moss viewer')
+    parser.add_argument('rm_file', help='The .rm file of the page to render')
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=sorted({1, 2, 4, 8, os.cpu_count() or 1}),
+                        help='The renderer pool sizes to compare')
+    parser.add_argument('-z', '--zoom', type=float, default=4, help='How far the page is zoomed in')
+    parser.add_argument('-c', '--chunk-size', type=int, default=100, help='The size of the chunks in pixels')
+    parser.add_argument('-r', '--rounds', type=int, default=3, help='How many times every chunk is rendered')
+    parser.add_argument('--landscape', action='store_true')
+    args = parser.parse_args()
+
+    document = make_document(args.rm_file, args.landscape)
+    paper_size = Renderer(SceneTree.from_document(document, PAGE_UUID)).paper_size
+    chunks = get_chunks(paper_size, args.zoom, args.chunk_size)
+    print(f"{Fore.YELLOW}Rendering {len(chunks)} chunks of {args.chunk_size}px, "
+          f"{args.rounds} rounds, {os.cpu_count()} cores{Fore.RESET}")
+
+    baseline = None
+    for workers in args.workers:
+        throughput = benchmark(document, chunks, workers, args.rounds)
+        baseline = baseline or throughput
+        print(f"{Fore.CYAN}{workers:>3} renderers: "
+              f"{Fore.GREEN}{throughput:8.1f} chunks/s "
+              f"{Fore.LIGHTBLACK_EX}x{throughput / baseline:.2f}{Fore.RESET}")
+
+
+if __name__ == '__main__':
+    main()
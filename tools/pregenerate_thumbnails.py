@@ -0,0 +1,164 @@
+"""
+Generates every missing document thumbnail without opening Moss.
+Only documents which are already in the sync cache get a thumbnail, nothing is downloaded.
+The thumbnails are packed exactly like Moss packs them, running it again only renders what is still missing.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from traceback import format_exc
+from typing import NamedTuple, Optional, Tuple
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Render without opening a window
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)  # Importable no matter where the tool is run from
+
+import pygameextra as pe
+from box import Box
+from colorama import Fore
+from slashr import SlashR
+
+from gui.gui import DEFAULT_CONFIG, USER_DATA_DIR, merge_dictionaries
+
+CONFIG_FILE = os.path.join(USER_DATA_DIR, 'config.json') if os.path.exists(
+    os.path.join(USER_DATA_DIR, 'config.json')) else os.path.join(REPO_DIR, 'config.json')
+
+with open(CONFIG_FILE, 'r') as f:
+    config, _ = merge_dictionaries(json.load(f), DEFAULT_CONFIG)
+config = Box(config)
+
+
+class HeadlessContext:
+    config = config
+    data = {}  # No templates are loaded, previews are rendered without them like in Moss
+
+
+setattr(pe.settings, 'config', config)
+setattr(pe.settings, 'config_file_path', CONFIG_FILE)
+setattr(pe.settings, 'game_context', HeadlessContext)
+
+from gui.defaults import Defaults
+
+from rm_api import API
+from rm_api.models import Content, File
+from gui.preview_handler import PreviewHandler, PreviewSources, pymupdf
+
+
+class ThumbnailJob(NamedTuple):
+    key: str
+    content: Content
+    rm_path: Optional[str]
+    pdf_path: Optional[str]
+    pdf_page: Optional[int]
+
+
+class ContentHolder:
+    # Rendering the lines only needs the content of the document to size the page
+    def __init__(self, content: Content):
+        self.content = content
+
+
+def cached_path(file: Optional[File]) -> Optional[str]:
+    if file is None:
+        return None
+    location = os.path.join(Defaults.SYNC_FILE_PATH, file.hash)
+    return location if os.path.isfile(location) else None
+
+
+def render_thumbnail(job: ThumbnailJob) -> Tuple[str, Optional[bytes], Optional[str]]:
+    try:
+        base_img = None
+        if job.pdf_path and pymupdf:
+            with pymupdf.open(job.pdf_path, filetype='pdf') as pdf:
+                base_img = PreviewHandler.render_pdf_page(pdf, job.pdf_page)
+
+        image = None
+        if job.rm_path:
+            with open(job.rm_path, 'rb') as f:
+                rm_bytes = f.read()
+            image = PreviewHandler.render_notebook_page(ContentHolder(job.content), rm_bytes)
+
+        image = PreviewHandler.compose_preview(base_img, image)
+        if image is None:
+            return job.key, None, 'Nothing to render'
+        # Only the main process writes to the thumbnail store
+        return job.key, PreviewHandler.encode_preview(image), None
+    except Exception:
+        return job.key, None, format_exc()
+
+
+def collect_jobs(api: API):
+    jobs = {}
+    existing = missing = 0
+    for document in api.documents.values():
+        sources = PreviewSources(document)
+        if sources.key in PreviewHandler.THUMBNAILS or \
+                PreviewHandler.THUMBNAILS.migrate_legacy(sources.key, sources.legacy_name) is not None:
+            existing += 1
+            continue
+        if sources.key in jobs:
+            continue  # Identical content shares a thumbnail
+        rm_path = cached_path(sources.rm_file)
+        pdf_path = cached_path(sources.pdf_file)
+        if (sources.rm_file and not rm_path) or (sources.pdf_file and not pdf_path) or not (rm_path or pdf_path):
+            missing += 1
+            continue
+        jobs[sources.key] = ThumbnailJob(
+            sources.key, document.content, rm_path, pdf_path,
+            sources.page.redirect.value if pdf_path else None
+        )
+    return list(jobs.values()), existing, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate the missing document thumbnails for Moss')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='How many processes render thumbnails, defaults to all cores')
+    args = parser.parse_args()
+
+    os.makedirs(Defaults.THUMB_FILE_PATH, exist_ok=True)
+    PreviewHandler.THUMBNAILS.load()
+
+    api = API(require_token=False, token_file_path=Defaults.TOKEN_FILE_PATH, sync_file_path=Defaults.SYNC_FILE_PATH,
+              uri=config.uri, discovery_uri=config.discovery_uri, author_id=config.author_id or None)
+    api.debug = config.debug
+
+    with SlashR(False) as sr:
+        sr.print(f"{Fore.YELLOW}Hold on, fetching documents using the API{Fore.RESET}")
+        api.get_documents(lambda loaded, total: sr.print(
+            f"{Fore.YELLOW}Fetching documents {loaded}/{total}{Fore.RESET}"))
+        jobs, existing, missing = collect_jobs(api)
+        sr.print(
+            f"{Fore.GREEN}{len(jobs)} thumbnails to generate, "
+            f"{existing} already generated, "
+            f"{missing} documents not downloaded{Fore.RESET}")
+    if not jobs:
+        return
+
+    failed = []
+    started = time.time()
+    with multiprocessing.Pool(max(1, args.workers)) as pool, SlashR(False) as sr:
+        for done, (key, data, error) in enumerate(pool.imap_unordered(render_thumbnail, jobs), 1):
+            if error:
+                failed.append((key, error))
+            else:
+                # Written right away, so an interrupted run keeps everything generated so far
+                PreviewHandler.THUMBNAILS.write(key, data)
+            elapsed = time.time() - started
+            remaining = elapsed / done * (len(jobs) - done)
+            sr.print(
+                f"{Fore.CYAN}[{done:^7}/{len(jobs):^7}] "
+                f"{Fore.RED}failed: {len(failed)} "
+                f"{Fore.LIGHTBLACK_EX}{elapsed:.0f}s elapsed, ~{remaining:.0f}s left{Fore.RESET}")
+
+    PreviewHandler.THUMBNAILS.close()
+    for key, error in failed:
+        print(f"{Fore.RED}Failed to generate {key}{Fore.RESET}\n{error}")
+    print(f"{Fore.GREEN}DONE! Generated {len(jobs) - len(failed)} thumbnails{Fore.RESET}")
+
+
+if __name__ == '__main__':
+    main()